@@ -0,0 +1,44 @@
+"""create livestock_headcount table
+
+Revision ID: 5d1f0c2a7b94
+Revises: 67051a81eaf3
+Create Date: 2026-10-18 14:26:53.118402
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d1f0c2a7b94'
+down_revision: Union[str, None] = '67051a81eaf3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    headcount = op.create_table(
+        'livestock_headcount',
+        sa.Column('location_id', sa.Integer, primary_key=True),
+        sa.Column('birth_year', sa.Integer, primary_key=True),
+        sa.Column('count', sa.Integer, nullable=False),
+    )
+    # fill the rollup from the existing livestock
+    livestock = sa.table(
+        'livestock', sa.column('location_id', sa.Integer), sa.column('birthdate', sa.DateTime)
+    )
+    birth_year = sa.cast(sa.extract('year', livestock.c.birthdate), sa.Integer)
+    op.execute(
+        headcount.insert().from_select(
+            ['location_id', 'birth_year', 'count'],
+            sa.select(livestock.c.location_id, birth_year, sa.func.count()).group_by(
+                livestock.c.location_id, birth_year
+            ),
+        )
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('livestock_headcount')
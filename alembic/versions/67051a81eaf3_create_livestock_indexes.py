@@ -0,0 +1,31 @@
+"""create livestock indexes
+
+Revision ID: 67051a81eaf3
+Revises: 88c77e3bed0d
+Create Date: 2026-10-18 10:02:17.845113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '67051a81eaf3'
+down_revision: Union[str, None] = '88c77e3bed0d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # location_id leads the composite index, which therefore also serves lookups and joins on
+    # location_id alone
+    op.create_index('ix_livestock_location_id_species', 'livestock', ['location_id', 'species'])
+    op.create_index('ix_livestock_birthplace_id', 'livestock', ['birthplace_id'])
+    op.create_index('ix_livestock_birthdate', 'livestock', ['birthdate'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_livestock_birthdate', 'livestock')
+    op.drop_index('ix_livestock_birthplace_id', 'livestock')
+    op.drop_index('ix_livestock_location_id_species', 'livestock')
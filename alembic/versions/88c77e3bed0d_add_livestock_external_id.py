@@ -0,0 +1,28 @@
+"""add livestock external_id
+
+Revision ID: 88c77e3bed0d
+Revises: 03078dd406ec
+Create Date: 2026-10-18 09:12:41.503217
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '88c77e3bed0d'
+down_revision: Union[str, None] = '03078dd406ec'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('livestock', sa.Column('external_id', sa.String(64), nullable=True))
+    op.create_unique_constraint('uq_livestock_external_id', 'livestock', ['external_id'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_livestock_external_id', 'livestock', type_='unique')
+    op.drop_column('livestock', 'external_id')
@@ -0,0 +1,30 @@
+"""create change_version table
+
+Revision ID: 9e3b6a41d2c8
+Revises: 5d1f0c2a7b94
+Create Date: 2026-10-18 17:02:41.530217
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9e3b6a41d2c8'
+down_revision: Union[str, None] = '5d1f0c2a7b94'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'change_version',
+        sa.Column('table_name', sa.String(64), primary_key=True),
+        sa.Column('version', sa.BigInteger, nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('change_version')
@@ -1,16 +1,25 @@
 """
 This module defines functions for authentication and authorization in the FastAPI application.
+
+Verified token claims are kept in a bounded in-process cache keyed by the token, so a bearer
+token reused across requests is only decoded and verified once. Each entry expires together with
+its token.
 """
+import time
 from datetime import datetime, timedelta
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 
+from app.cache import LRUCache
 from app.config import config
 
 SECRET_KEY = config.get("SECRET_KEY")
 ALGORITHM = config.get("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(config.get("ACCESS_TOKEN_EXPIRE_MINUTES"))
+TOKEN_CACHE_SIZE = int(config.get("TOKEN_CACHE_SIZE") or 10000)
+
+token_cache = LRUCache(TOKEN_CACHE_SIZE)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
@@ -34,7 +43,7 @@ def create_access_token(data: dict):
 
 def verify_token(token: str = Depends(oauth2_scheme)):
     """
-    Verifies the validity of a JWT access token.
+    Verifies the validity of a JWT access token, answering from the token cache when possible.
 
     Args:
         token (str): JWT access token.
@@ -42,14 +51,20 @@ def verify_token(token: str = Depends(oauth2_scheme)):
     Returns:
         dict: User information decoded from the token, or None if invalid.
     """
+    payload = token_cache.get(token, None)
+    if payload is not None:
+        return payload
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
     except JWTError:
         return None
+    expire = payload.get("exp")
+    if expire is not None and expire > time.time():
+        token_cache.set(token, payload, ttl=expire - time.time())
+    return payload
 
 
-def get_user(token: str = Depends(oauth2_scheme)):
+async def get_user(token: str = Depends(oauth2_scheme)):
     """
     Retrieves the user information from a JWT access token.
 
@@ -74,6 +89,42 @@ def get_user(token: str = Depends(oauth2_scheme)):
     if payload is None:
         raise credentials_exception("Could not validate credentials")
     expire = payload.get("exp")
-    if expire < int(datetime.now().strftime("%s")):
+    if expire < int(time.time()):
         raise credentials_exception("Credentials are expired")
     return payload.get("sub")
+
+
+def is_admin(token: str) -> bool:
+    """
+    Checks whether a JWT access token is valid, unexpired and carries the admin claim.
+
+    Args:
+        token (str): JWT access token.
+
+    Returns:
+        bool: True if the token belongs to an admin, False otherwise.
+    """
+    payload = verify_token(token)
+    if payload is None or payload.get("exp", 0) < int(time.time()):
+        return False
+    return bool(payload.get("admin"))
+
+
+async def get_admin(token: str = Depends(oauth2_scheme)):
+    """
+    Retrieves the user information from a JWT access token that must belong to an admin.
+
+    Args:
+        token (str): JWT access token.
+
+    Returns:
+        str: User ID.
+
+    Raises:
+        HTTPException 401: If the token is invalid or expired.
+        HTTPException 403: If the user is not an admin.
+    """
+    user = await get_user(token)
+    if not is_admin(token):
+        raise HTTPException(status.HTTP_403_FORBIDDEN, detail="Admin privileges required")
+    return user
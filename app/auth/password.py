@@ -0,0 +1,136 @@
+"""
+This module defines functions for hashing and verifying user passwords.
+
+bcrypt is deliberately slow, so hashing and verification never run on the event loop. They run
+in a small dedicated thread pool (bcrypt releases the GIL while it works), and the number of
+operations waiting for that pool is capped so that a burst of logins is turned away instead of
+queueing without bound. The pool records how long operations wait and run.
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+from passlib.context import CryptContext
+
+from app.config import config
+from app.metrics import section_duration
+
+PASSWORD_HASH_WORKERS = int(config.get("PASSWORD_HASH_WORKERS") or 2)
+PASSWORD_HASH_MAX_PENDING = int(config.get("PASSWORD_HASH_MAX_PENDING") or 64)
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+class HashPoolBusy(Exception):
+    """
+    Raised when too many password operations are already waiting for the hashing pool.
+    """
+
+
+class HashPool:
+    """
+    Bounded thread pool running password hashing operations.
+
+    Attributes:
+        max_pending: The maximum number of operations queued or running at once.
+        pending: The number of operations currently queued or running.
+        completed: The number of finished operations.
+        rejected: The number of operations turned away because the pool was full.
+        queue_time_total: The total number of seconds operations waited for a worker.
+        queue_time_max: The longest number of seconds an operation waited for a worker.
+        run_time_total: The total number of seconds spent hashing.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.queue_time_total = 0.0
+        self.queue_time_max = 0.0
+        self.run_time_total = 0.0
+
+    async def run(self, func: Callable[..., Any], *args) -> Any:
+        """
+        Runs a function in the pool and waits for its result without blocking the event loop.
+
+        Args:
+            func: The function to run.
+            *args: The arguments of the function.
+
+        Returns:
+            The return value of the function.
+
+        Raises:
+            HashPoolBusy: If `max_pending` operations are already queued or running.
+        """
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HashPoolBusy()
+
+        def timed():
+            started = time.perf_counter()
+            return started, func(*args), time.perf_counter()
+
+        self.pending += 1
+        submitted = time.perf_counter()
+        try:
+            started, result, finished = await asyncio.get_running_loop().run_in_executor(
+                self.executor, timed
+            )
+        finally:
+            self.pending -= 1
+        self.completed += 1
+        self.queue_time_total += started - submitted
+        self.queue_time_max = max(self.queue_time_max, started - submitted)
+        self.run_time_total += finished - started
+        section_duration.observe(started - submitted, "password_hash_queue")
+        section_duration.observe(finished - started, "password_hash")
+        return result
+
+    def stats(self) -> dict:
+        """
+        Reports the load of the pool and the time operations spent queued and running.
+        """
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "queue_time_total": self.queue_time_total,
+            "queue_time_max": self.queue_time_max,
+            "run_time_total": self.run_time_total,
+        }
+
+
+hash_pool = HashPool(PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING)
+
+
+async def hash_password(password: str) -> str:
+    """
+    Hashes a password in the hashing pool.
+
+    Args:
+        password (str): The plain-text password.
+
+    Returns:
+        str: The salted bcrypt hash of the password.
+    """
+    return await hash_pool.run(pwd_context.hash, password)
+
+
+async def verify_password(password: str, hashed_password: str) -> bool:
+    """
+    Checks a password against its hash in the hashing pool.
+
+    Args:
+        password (str): The plain-text password.
+        hashed_password (str): The stored bcrypt hash.
+
+    Returns:
+        bool: True if the password matches the hash, False otherwise.
+    """
+    return await hash_pool.run(pwd_context.verify, password, hashed_password)
@@ -0,0 +1,127 @@
+"""
+This module provides the in-process cache used for data that is read far more often than it
+changes.
+
+Every worker process holds its own caches, so an invalidation only reaches the worker that made
+the change; the TTL bounds how long other workers may keep serving the previous value.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Iterable
+
+MISSING = object()
+
+
+class LRUCache:
+    """
+    Bounded mapping that evicts its least recently used entry when full and expires entries after
+    a time-to-live. It is safe to use from several threads.
+
+    Attributes:
+        maxsize: The maximum number of entries.
+        ttl: The default number of seconds an entry stays valid, or None to never expire.
+        counts: The number of lookups answered from the cache (`hits`), of lookups that found no
+            valid entry (`misses`), of entries dropped to make room for new ones (`evictions`)
+            and of entries dropped because they were too old (`expirations`).
+        version: The number of times the cache was cleared.
+    """
+
+    def __init__(self, maxsize: int, ttl: float = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version = 0
+        self.counts = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        """
+        Looks up an entry and marks it as recently used.
+
+        Args:
+            key: The key of the entry.
+            default: The value to return when there is no valid entry.
+
+        Returns:
+            The cached value, or `default`.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] is not None and entry[0] <= time.monotonic():
+                del self._entries[key]
+                self.counts["expirations"] += 1
+                entry = None
+            if entry is None:
+                self.counts["misses"] += 1
+                return default
+            self._entries.move_to_end(key)
+            self.counts["hits"] += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: float = None, version: int = None):
+        """
+        Stores an entry, evicting the least recently used entries if the cache is full.
+
+        Args:
+            key: The key of the entry.
+            value: The value to cache.
+            ttl: The number of seconds the entry stays valid, instead of the default TTL.
+            version: The `version` of the cache read before the value was loaded. If the cache
+                was cleared since, the value may predate the change that cleared it and is not
+                stored.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        expires = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.counts["evictions"] += 1
+
+    def clear(self):
+        """
+        Removes every entry, and keeps values loaded before from being stored.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.version += 1
+
+    def stats(self) -> dict:
+        """
+        Reports the size of the cache and its hit, miss, eviction and expiration counters.
+        """
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            **self.counts,
+        }
+
+
+class ScopeVersions:
+    """
+    Version counters for the scopes of some cached data. A scope's version changes whenever data
+    in that scope changes, so a cached value remembers the version it was computed from and is
+    outdated once the version differs.
+
+    The scope None stands for all of the data and changes together with every other scope.
+    """
+
+    def __init__(self):
+        self._versions = {}
+
+    def get(self, scope: Hashable) -> int:
+        """
+        Returns the current version of a scope.
+        """
+        return self._versions.get(scope, 0)
+
+    def bump(self, scopes: Iterable[Hashable]):
+        """
+        Marks the given scopes, and the scope None, as changed.
+        """
+        for scope in {None, *scopes}:
+            self._versions[scope] = self._versions.get(scope, 0) + 1
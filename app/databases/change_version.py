@@ -0,0 +1,62 @@
+"""
+This module maintains the change version of each table, a counter bumped by every write
+transaction that changes the table.
+
+Writes call `bump_versions` as the last statement before they commit, so a version and the rows it
+describes always become visible together, and the row lock taken on the version is held as
+briefly as possible. Readers use `get_versions` to tag their responses (see `app.etag`).
+"""
+from typing import Dict, Iterable
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.databases.dialect import upsert
+from app.models.model import ChangeVersionDB
+
+# table name -> change version
+Versions = Dict[str, int]
+
+
+async def bump_versions(sess: AsyncSession, tables: Iterable[str]):
+    """
+    Increments the change version of tables without committing.
+
+    Args:
+        sess: The database session of the write.
+        tables: The names of the tables changed by the write.
+    """
+    # a stable order keeps concurrent writers from locking the same rows in opposite orders
+    tables = sorted(set(tables))
+    query = upsert(sess, ChangeVersionDB).values(
+        [{"table_name": table, "version": 1} for table in tables]
+    )
+    await sess.execute(
+        query.on_conflict_do_update(
+            index_elements=[ChangeVersionDB.table_name],
+            set_={"version": ChangeVersionDB.version + 1},
+        )
+    )
+
+
+async def get_versions(sess: AsyncSession, tables: Iterable[str]) -> Versions:
+    """
+    Retrieves the change version of tables.
+
+    Args:
+        sess: The database session of the current request.
+        tables: The names of the tables.
+
+    Returns:
+        A dictionary mapping each table name to its version, 0 for tables never written.
+    """
+    tables = list(tables)
+    versions = dict(
+        (
+            await sess.execute(
+                select(ChangeVersionDB.table_name, ChangeVersionDB.version).where(
+                    ChangeVersionDB.table_name.in_(tables)
+                )
+            )
+        ).all()
+    )
+    return {table: versions.get(table, 0) for table in tables}
@@ -0,0 +1,49 @@
+"""
+This module provides the opaque cursors used for keyset pagination of list endpoints.
+
+A cursor encodes the primary key of the last record of a page. The next page is then read with
+`WHERE id > :key ORDER BY id LIMIT :limit`, which costs the same for every page.
+"""
+import base64
+import binascii
+from typing import Any, Callable
+
+
+class InvalidCursor(ValueError):
+    """
+    Raised when a pagination cursor cannot be decoded.
+    """
+
+
+def encode_cursor(key: Any) -> str:
+    """
+    Encodes the primary key of the last record of a page as an opaque cursor.
+
+    Args:
+        key: The primary key (an integer or a UUID).
+
+    Returns:
+        A URL-safe string identifying the position after that record.
+    """
+    return base64.urlsafe_b64encode(str(key).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, key_type: Callable[[str], Any]) -> Any:
+    """
+    Decodes a cursor produced by `encode_cursor` back into a primary key.
+
+    Args:
+        cursor: The opaque cursor sent by the client.
+        key_type: The type of the primary key, e.g. `int` or `uuid.UUID`.
+
+    Returns:
+        The primary key of the last record of the previous page.
+
+    Raises:
+        InvalidCursor: If the cursor is malformed.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return key_type(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError) as exc:
+        raise InvalidCursor(cursor) from exc
@@ -0,0 +1,38 @@
+"""
+This module provides helpers for statements whose syntax differs between the supported database
+backends (PostgreSQL in production, SQLite for local testing).
+"""
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+INSERTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+
+def dialect_name(sess: AsyncSession) -> str:
+    """
+    Returns the name of the database backend a session is bound to.
+
+    Args:
+        sess: The database session.
+
+    Returns:
+        The dialect name, e.g. `postgresql` or `sqlite`.
+    """
+    return sess.bind.dialect.name
+
+
+def upsert(sess: AsyncSession, table):
+    """
+    Creates an INSERT statement supporting `ON CONFLICT` clauses for the backend of a session.
+
+    Args:
+        sess: The database session the statement will be executed with.
+        table: The table or mapped class to insert into.
+
+    Returns:
+        An Insert construct with `on_conflict_do_update` and `on_conflict_do_nothing`.
+    """
+    return INSERTS[dialect_name(sess)](table)
@@ -0,0 +1,149 @@
+"""
+This module maintains the livestock headcount rollup: the number of livestock at each location
+per birth year.
+
+Livestock writes pass the changes they make to `add_headcounts` in their own transaction, so the
+rollup is always consistent with the livestock table and forecasts read a few rows per year
+instead of every animal. The rollup can be checked against the livestock table and rebuilt from
+the command line.
+
+Usage:
+    python -m app.databases.headcount verify
+    python -m app.databases.headcount rebuild
+"""
+import argparse
+import asyncio
+import sys
+from typing import List, Mapping, Tuple
+from sqlalchemy import Integer, cast, delete, extract, func, insert, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.databases.change_version import bump_versions
+from app.databases.connection import Session, engine
+from app.databases.dialect import dialect_name, upsert
+from app.models.model import HeadcountDB, LivestockDB
+
+# (location_id, birth_year) -> change in the number of livestock
+HeadcountChanges = Mapping[Tuple[int, int], int]
+TABLES = [HeadcountDB.__tablename__]
+
+
+async def add_headcounts(sess: AsyncSession, changes: HeadcountChanges):
+    """
+    Applies changes to the rollup without committing, removing the rows that drop to zero.
+
+    Args:
+        sess: The database session of the livestock write.
+        changes: The change in the number of livestock per location ID and birth year.
+    """
+    # a stable order keeps concurrent writers from locking the same rows in opposite orders
+    changes = {key: change for key, change in sorted(changes.items()) if change}
+    if not changes:
+        return
+    query = upsert(sess, HeadcountDB).values(
+        [
+            {"location_id": location_id, "birth_year": birth_year, "count": change}
+            for (location_id, birth_year), change in changes.items()
+        ]
+    )
+    await sess.execute(
+        query.on_conflict_do_update(
+            index_elements=[HeadcountDB.location_id, HeadcountDB.birth_year],
+            set_={"count": HeadcountDB.count + query.excluded["count"]},
+        )
+    )
+    decreased = {location_id for (location_id, _), change in changes.items() if change < 0}
+    if decreased:
+        await sess.execute(
+            delete(HeadcountDB).where(
+                HeadcountDB.location_id.in_(decreased), HeadcountDB.count <= 0
+            )
+        )
+
+
+def _count_livestocks():
+    """
+    Returns the query counting the livestock table the way the rollup does.
+    """
+    birth_year = cast(extract("year", LivestockDB.birthdate), Integer)
+    return select(LivestockDB.location_id, birth_year, func.count()).group_by(
+        LivestockDB.location_id, birth_year
+    )
+
+
+async def verify_headcounts(sess: AsyncSession) -> List[Tuple[int, int, int, int]]:
+    """
+    Compares the rollup with a full count of the livestock table.
+
+    Args:
+        sess: The database session to read with.
+
+    Returns:
+        The location ID, birth year, expected count and stored count of every row that differs.
+    """
+    expected = {(i, year): count for i, year, count in await sess.execute(_count_livestocks())}
+    stored = {
+        (i, year): count
+        for i, year, count in await sess.execute(
+            select(HeadcountDB.location_id, HeadcountDB.birth_year, HeadcountDB.count)
+        )
+    }
+    mismatches = []
+    for key in sorted(expected.keys() | stored.keys()):
+        if expected.get(key, 0) != stored.get(key, 0):
+            mismatches.append((*key, expected.get(key, 0), stored.get(key, 0)))
+    return mismatches
+
+
+async def rebuild_headcounts(sess: AsyncSession):
+    """
+    Replaces the rollup with a full count of the livestock table, without committing.
+
+    Args:
+        sess: The database session to write with.
+    """
+    if dialect_name(sess) == "postgresql":
+        # keep livestock writes out until the rebuilt rollup is committed
+        await sess.execute(text("LOCK TABLE livestock IN SHARE MODE"))
+    await sess.execute(delete(HeadcountDB))
+    await sess.execute(
+        insert(HeadcountDB).from_select(
+            ["location_id", "birth_year", "count"], _count_livestocks()
+        )
+    )
+    await bump_versions(sess, TABLES)
+
+
+async def main(argv: List[str] = None) -> int:
+    """
+    Verifies or rebuilds the rollup from the command line.
+
+    Returns:
+        The exit status: 1 if `verify` found rows that differ from the livestock table, 0
+        otherwise.
+    """
+    parser = argparse.ArgumentParser(description="Verify or rebuild the livestock headcounts.")
+    parser.add_argument("action", choices=["verify", "rebuild"])
+    args = parser.parse_args(argv)
+
+    try:
+        async with Session() as sess:
+            mismatches = await verify_headcounts(sess)
+            for location_id, birth_year, expected, stored in mismatches:
+                print(
+                    f"location {location_id}, year {birth_year}: "
+                    f"expected {expected}, stored {stored}"
+                )
+            if args.action == "rebuild":
+                await rebuild_headcounts(sess)
+                await sess.commit()
+                print(f"Rebuilt the headcounts, {len(mismatches)} rows differed")
+            else:
+                print(f"{len(mismatches)} rows differ")
+    finally:
+        await engine.dispose()
+    return 1 if mismatches and args.action == "verify" else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(sys.argv[1:])))
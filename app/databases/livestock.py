@@ -1,105 +1,423 @@
 """
 This module provides functions for managing livestock data within the application.
+
+Every write that may change the number of livestock per location and birth year updates the
+headcount rollup in the same transaction, and bumps `livestock_versions` once it is committed,
+scoped by location ID, so that results derived from those counts (such as forecasts) can tell
+when they are outdated. Every write also bumps the change version of the livestock table right
+before committing, which the ETags of the livestock and forecast responses are derived from.
 """
-from typing import List
-from app.models.model import LivestockDB
-from app.schemas.livestock import Livestock
-from app.databases.connection import sess
+import uuid
+from collections import Counter
+from datetime import datetime, time
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.cache import ScopeVersions
+from app.databases.change_version import bump_versions
+from app.models.model import HeadcountDB, LivestockDB
+from app.databases.cursor import decode_cursor, encode_cursor
+from app.databases.dialect import dialect_name, upsert
+from app.databases.headcount import add_headcounts
+from app.databases.location import get_existing_location_ids
+from app.schemas.livestock import Livestock, LivestockFilter
+
+LIVESTOCK_COLUMNS = tuple(column.name for column in LivestockDB.__table__.columns)
+# columns a client may change, also overwritten when a bulk upsert hits an existing external_id
+UPDATABLE_COLUMNS = tuple(
+    name for name in LIVESTOCK_COLUMNS if name not in ("id", "external_id")
+)
+BULK_BATCH_SIZE = 500
+LOCATION_ID = LIVESTOCK_COLUMNS.index("location_id")
+BIRTHDATE = LIVESTOCK_COLUMNS.index("birthdate")
+TABLES = [LivestockDB.__tablename__]
 
+livestock_versions = ScopeVersions()
 
-def create_livestock(new_livestock: Livestock) -> int:
+
+async def create_livestock(sess: AsyncSession, new_livestock: Livestock) -> uuid.UUID:
     """
-    Creates a new livestock record in the database.
+    Creates a new livestock record in the database with a single `INSERT ... RETURNING` statement.
 
     Args:
+        sess: The database session of the current request.
         new_livestock: A Livestock object containing information about the new livestock.
 
     Returns:
         The ID of the newly created livestock record.
     """
-    sess.add(new_livestock)
-    sess.commit()
-    new_livestock_id = new_livestock.id
-    sess.close()
+    new_livestock_id = await sess.scalar(
+        insert(LivestockDB).values(**new_livestock.model_dump()).returning(LivestockDB.id)
+    )
+    await add_headcounts(
+        sess, {(new_livestock.location_id, new_livestock.birthdate.year): 1}
+    )
+    await bump_versions(sess, TABLES)
+    await sess.commit()
+    livestock_versions.bump([new_livestock.location_id])
     return new_livestock_id
 
 
-def get_livestocks() -> List[dict]:
+def _filter_livestocks(query, filters: LivestockFilter = None):
+    """
+    Adds the WHERE clauses of a livestock filter to a query.
+    """
+    if filters is None:
+        return query
+    if filters.location_id is not None:
+        query = query.where(LivestockDB.location_id == filters.location_id)
+    if filters.species is not None:
+        query = query.where(LivestockDB.species == filters.species)
+    if filters.breed is not None:
+        query = query.where(LivestockDB.breed == filters.breed)
+    if filters.gender is not None:
+        query = query.where(LivestockDB.gender == filters.gender)
+    if filters.born_after is not None:
+        query = query.where(LivestockDB.birthdate >= filters.born_after)
+    if filters.born_before is not None:
+        query = query.where(LivestockDB.birthdate < filters.born_before)
+    return query
+
+
+async def get_existing_external_ids(
+    sess: AsyncSession, external_ids: Iterable[str]
+) -> Set[str]:
+    """
+    Checks which of the given external IDs are already used by livestock records.
+
+    Args:
+        sess: The database session of the current request.
+        external_ids: The external IDs to check.
+
+    Returns:
+        The subset of the given external IDs that already exist.
+    """
+    external_ids = set(external_ids)
+    if not external_ids:
+        return set()
+    return set(
+        await sess.scalars(
+            select(LivestockDB.external_id).where(
+                LivestockDB.external_id.in_(external_ids)
+            )
+        )
+    )
+
+
+async def load_livestocks(sess: AsyncSession, records: List[tuple]):
+    """
+    Loads many new livestock records as fast as the backend allows, without committing: with
+    `COPY FROM STDIN` on PostgreSQL and with a batched `executemany` INSERT otherwise. The caller
+    bumps `livestock_versions` for the loaded locations once it has committed.
+
+    Args:
+        sess: The database session to write with.
+        records: The records to insert, as tuples in the order of `LIVESTOCK_COLUMNS`.
+    """
+    if dialect_name(sess) == "postgresql":
+        # The asyncpg transaction is only opened by the first statement run through SQLAlchemy;
+        # run one so that the COPY below becomes part of the session's transaction.
+        await sess.execute(select(1))
+        conn = await (await sess.connection()).get_raw_connection()
+        await conn.driver_connection.copy_records_to_table(
+            LivestockDB.__tablename__, records=records, columns=LIVESTOCK_COLUMNS
+        )
+    else:
+        await sess.execute(
+            insert(LivestockDB), [dict(zip(LIVESTOCK_COLUMNS, i)) for i in records]
+        )
+    await add_headcounts(
+        sess, Counter((i[LOCATION_ID], i[BIRTHDATE].year) for i in records)
+    )
+    await bump_versions(sess, TABLES)
+
+
+async def upsert_livestocks(sess: AsyncSession, livestocks: List[Livestock]) -> List[dict]:
+    """
+    Creates or updates many livestock records at once, using multi-row
+    `INSERT ... ON CONFLICT (external_id) DO UPDATE` statements in a single transaction.
+
+    Records with an `external_id` that already exists are updated in place, which makes retrying
+    a bulk request safe. Records without an `external_id` are always created.
+
+    Args:
+        sess: The database session of the current request.
+        livestocks: The Livestock objects to create or update.
+
+    Returns:
+        A list with one dictionary per supplied record, in the same order, containing its index,
+        its external ID, its status (`created`, `updated` or `error`) and either its ID or the
+        reason it was rejected.
+    """
+    existing_locations = await get_existing_location_ids(
+        sess, {i.location_id for i in livestocks} | {i.birthplace_id for i in livestocks}
+    )
+    results = []
+    rows = []
+    seen = set()
+    for index, livestock in enumerate(livestocks):
+        result = {"index": index, "external_id": livestock.external_id}
+        results.append(result)
+        if not {livestock.location_id, livestock.birthplace_id} <= existing_locations:
+            result.update(
+                status="error", detail="Location with supplied ID does not exist"
+            )
+        elif livestock.external_id is not None and livestock.external_id in seen:
+            result.update(status="error", detail="Duplicate external ID in request")
+        else:
+            seen.add(livestock.external_id)
+            rows.append((result, {"id": uuid.uuid4(), **livestock.model_dump()}))
+
+    headcounts = Counter()
+    previous_locations = set()
+    for start in range(0, len(rows), BULK_BATCH_SIZE):
+        batch = rows[start : start + BULK_BATCH_SIZE]
+        # the current location and birth year of the records about to be updated; a record
+        # inserted concurrently under the same external ID is counted as created, which
+        # `python -m app.databases.headcount verify` reports
+        updated = {
+            external_id: (location_id, birthdate.year)
+            for external_id, location_id, birthdate in await sess.execute(
+                select(LivestockDB.external_id, LivestockDB.location_id, LivestockDB.birthdate)
+                .where(
+                    LivestockDB.external_id.in_(
+                        {i["external_id"] for _, i in batch if i["external_id"] is not None}
+                    )
+                )
+                .with_for_update()
+            )
+        }
+        previous_locations.update(location_id for location_id, _ in updated.values())
+        query = upsert(sess, LivestockDB).values([i for _, i in batch])
+        query = query.on_conflict_do_update(
+            index_elements=[LivestockDB.external_id],
+            set_={name: query.excluded[name] for name in UPDATABLE_COLUMNS},
+        ).returning(LivestockDB.id, LivestockDB.external_id)
+        returned = {}
+        for _id, external_id in await sess.execute(query):
+            returned[external_id if external_id is not None else _id] = _id
+        for result, row in batch:
+            key = row["external_id"] if row["external_id"] is not None else row["id"]
+            result.update(
+                status="updated" if row["external_id"] in updated else "created",
+                id=returned[key],
+            )
+            headcounts[(row["location_id"], row["birthdate"].year)] += 1
+            if row["external_id"] in updated:
+                headcounts[updated[row["external_id"]]] -= 1
+
+    await add_headcounts(sess, headcounts)
+    if rows:
+        await bump_versions(sess, TABLES)
+    await sess.commit()
+    livestock_versions.bump({row["location_id"] for _, row in rows} | previous_locations)
+    return results
+
+
+async def get_livestocks(
+    sess: AsyncSession,
+    limit: int = 100,
+    after: str = None,
+    filters: LivestockFilter = None,
+) -> Tuple[List[dict], Optional[str]]:
+    """
+    Retrieves a page of livestock records from the database, ordered by ID.
+
+    Args:
+        sess: The database session of the current request.
+        limit: The maximum number of records to return.
+        after: The cursor returned with the previous page, or None for the first page.
+        filters: The filters the records have to match, if any.
+
+    Returns:
+        A list of dictionaries, each representing a livestock record, and the cursor of the next
+        page, or None if this is the last page.
+
+    Raises:
+        InvalidCursor: If the supplied cursor is malformed.
+    """
+    # plain rows rather than ORM instances: nothing is added to the identity map
+    query = select(*LivestockDB.__table__.columns).order_by(LivestockDB.id).limit(limit + 1)
+    query = _filter_livestocks(query, filters)
+    if after is not None:
+        query = query.where(LivestockDB.id > decode_cursor(after, uuid.UUID))
+    livestocks = [i._asdict() for i in await sess.execute(query)]
+    next_cursor = None
+    if len(livestocks) > limit:
+        livestocks = livestocks[:limit]
+        next_cursor = encode_cursor(livestocks[-1]["id"])
+    return livestocks, next_cursor
+
+
+async def count_livestocks_by_year(
+    sess: AsyncSession, location_id: int = None
+) -> Dict[int, int]:
     """
-    Retrieves a list of all livestock records from the database.
+    Counts the livestock born in each year, optionally limited to a single location, from the
+    headcount rollup.
+
+    Args:
+        sess: The database session of the current request.
+        location_id: The ID of the current location to count livestock for, or None for all.
 
     Returns:
-        A list of dictionaries, each representing a livestock record.
+        A dictionary mapping each birth year to the number of livestock born in that year.
     """
-    livestocks = sess.query(LivestockDB).order_by(LivestockDB.id).all()
-    livestocks_dict = []
-    for i in livestocks:
-        livestocks_dict.append(i.to_dict())
-    return livestocks_dict
+    query = (
+        select(HeadcountDB.birth_year, func.sum(HeadcountDB.count))
+        .group_by(HeadcountDB.birth_year)
+        .order_by(HeadcountDB.birth_year)
+    )
+    if location_id is not None:
+        query = query.where(HeadcountDB.location_id == location_id)
+    rows = await sess.execute(query)
+    return {year: int(count) for year, count in rows}
 
 
-def get_livestock_by_id(_id: int) -> dict:
+async def count_livestocks_by_location_and_year(
+    sess: AsyncSession,
+) -> Dict[int, Dict[int, int]]:
+    """
+    Counts the livestock born in each year at each location, from the headcount rollup.
+
+    Args:
+        sess: The database session of the current request.
+
+    Returns:
+        A dictionary mapping each location ID to a dictionary mapping each birth year to the
+        number of livestock at that location born in that year.
+    """
+    query = select(
+        HeadcountDB.location_id, HeadcountDB.birth_year, HeadcountDB.count
+    ).order_by(HeadcountDB.location_id, HeadcountDB.birth_year)
+    counts = {}
+    for location_id, year, count in await sess.execute(query):
+        counts.setdefault(location_id, {})[year] = count
+    return counts
+
+
+async def stream_livestocks(
+    sess: AsyncSession, batch_size: int = 10000, filters: LivestockFilter = None
+) -> AsyncIterator[List[tuple]]:
+    """
+    Streams livestock records from a server-side cursor, one batch of rows at a time.
+
+    Args:
+        sess: The database session to read with. It stays in use until the iteration ends.
+        batch_size: The number of rows fetched from the cursor per batch.
+        filters: The filters the records have to match, if any.
+
+    Yields:
+        Lists of row tuples, with the columns in the order of `LIVESTOCK_COLUMNS`.
+    """
+    query = select(*LivestockDB.__table__.columns).execution_options(
+        yield_per=batch_size
+    )
+    result = await sess.stream(_filter_livestocks(query, filters))
+    async for partition in result.partitions():
+        yield partition
+
+
+async def get_livestock_by_id(sess: AsyncSession, _id: uuid.UUID) -> dict:
     """
     Retrieves a specific livestock record by its ID.
 
     Args:
+        sess: The database session of the current request.
         _id: The ID of the livestock record to retrieve.
 
     Returns:
         A dictionary representing the livestock record, or None if no record is found.
     """
-    livestock = sess.query(LivestockDB).filter(LivestockDB.id == _id).first()
+    livestock = (
+        await sess.execute(
+            select(*LivestockDB.__table__.columns).where(LivestockDB.id == _id)
+        )
+    ).first()
     if livestock:
-        return livestock.to_dict()
+        return livestock._asdict()
     return None
 
 
-def update_livestock(_id: int, updated_livestock: dict) -> dict:
+async def update_livestock(
+    sess: AsyncSession, _id: uuid.UUID, updated_livestock: dict
+) -> dict:
     """
-    Updates an existing livestock record in the database.
+    Updates an existing livestock record in the database with a single
+    `UPDATE ... RETURNING` statement.
 
     Args:
+        sess: The database session of the current request.
         _id: The ID of the livestock record to update.
-        updated_livestock: A dictionary containing updated information for the livestock.
+        updated_livestock: A dictionary containing updated information for the livestock, with
+            values of the types of `LivestockUpdate`.
 
     Returns:
-        A dictionary representing the updated livestock record.
-    """
-    livestock = sess.query(LivestockDB).filter(LivestockDB.id == _id).first()
+        A dictionary representing the updated livestock record, or None if no record is found.
 
-    if "name" in updated_livestock:
-        livestock.name = updated_livestock["name"]
-    if "breed" in updated_livestock:
-        livestock.breed = updated_livestock["breed"]
-    if "species" in updated_livestock:
-        livestock.species = updated_livestock["species"]
-    if "birthplace_id" in updated_livestock:
-        livestock.birthplace_id = updated_livestock["birthplace_id"]
-    if "birthdate" in updated_livestock:
-        livestock.birthdate = updated_livestock["birthdate"]
-    if "gender" in updated_livestock:
-        livestock.gender = updated_livestock["gender"]
-    if "location_id" in updated_livestock:
-        livestock.location_id = updated_livestock["location_id"]
-
-    sess.commit()
-    livestock_dict = livestock.to_dict()
-    sess.close()
-    return livestock_dict
+    Raises:
+        IntegrityError: If a supplied location ID does not exist.
+    """
+    values = {k: v for k, v in updated_livestock.items() if k in UPDATABLE_COLUMNS}
+    if not values:
+        return await get_livestock_by_id(sess, _id)
+    if "birthdate" in values:
+        values["birthdate"] = datetime.combine(values["birthdate"], time())
+    previous = None
+    if "location_id" in values or "birthdate" in values:
+        previous = (
+            await sess.execute(
+                select(LivestockDB.location_id, LivestockDB.birthdate)
+                .where(LivestockDB.id == _id)
+                .with_for_update()
+            )
+        ).first()
+    livestock = (
+        await sess.execute(
+            update(LivestockDB)
+            .where(LivestockDB.id == _id)
+            .values(**values)
+            .returning(*LivestockDB.__table__.columns)
+        )
+    ).first()
+    if livestock and previous:
+        headcounts = Counter()
+        headcounts[(previous.location_id, previous.birthdate.year)] -= 1
+        headcounts[(livestock.location_id, livestock.birthdate.year)] += 1
+        await add_headcounts(sess, headcounts)
+    if livestock:
+        await bump_versions(sess, TABLES)
+    await sess.commit()
+    if not livestock:
+        return None
+    if previous:
+        livestock_versions.bump({previous.location_id, livestock.location_id})
+    return livestock._asdict()
 
 
-def delete_livestock(_id: int) -> int:
+async def delete_livestock(sess: AsyncSession, _id: uuid.UUID) -> uuid.UUID:
     """
-    Deletes a livestock record from the database.
+    Deletes a livestock record from the database with a single `DELETE ... RETURNING` statement.
 
     Args:
+        sess: The database session of the current request.
         _id: The ID of the livestock record to delete.
 
     Returns:
-        The ID of the deleted livestock record.
+        The ID of the deleted livestock record, or None if no record is found.
     """
-    livestock = sess.query(LivestockDB).filter(LivestockDB.id == _id).first()
-    sess.delete(livestock)
-    sess.commit()
-    sess.close()
-    return _id
+    deleted = (
+        await sess.execute(
+            delete(LivestockDB)
+            .where(LivestockDB.id == _id)
+            .returning(LivestockDB.id, LivestockDB.location_id, LivestockDB.birthdate)
+        )
+    ).first()
+    if deleted:
+        await add_headcounts(sess, {(deleted.location_id, deleted.birthdate.year): -1})
+        await bump_versions(sess, TABLES)
+    await sess.commit()
+    if not deleted:
+        return None
+    livestock_versions.bump([deleted.location_id])
+    return deleted.id
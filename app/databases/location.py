@@ -1,97 +1,276 @@
 """
 This module provides functions for managing location data within the application.
+
+Locations are reference data that rarely change, so the module keeps two in-process caches:
+
+- `location_ids`: The IDs of existing locations, which livestock writes validate against.
+- `location_cache`: A read-through LRU cache of location pages and records, cleared by every
+                    location write made through this module. Like the ID set, a read that raced
+                    with a write is not cached. Pages are cached under the version of the location
+                    table they were requested at, so that a page cached before a write made by
+                    another worker is never served under the ETag of that write.
+
+Every write also bumps the change version of the location table before committing, which the ETag
+of the location list is derived from.
 """
-from typing import List
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.cache import MISSING, LRUCache
+from app.config import config
 from app.models.model import LocationDB
+from app.databases.change_version import Versions, bump_versions
+from app.databases.cursor import decode_cursor, encode_cursor
 from app.schemas.location import Location
-from app.databases.connection import sess
 
+# columns a client may change
+UPDATABLE_COLUMNS = ("type", "name", "address")
+LOCATION_ID_CACHE_TTL = float(config.get("LOCATION_ID_CACHE_TTL") or 60)
+LOCATION_CACHE_SIZE = int(config.get("LOCATION_CACHE_SIZE") or 1024)
+LOCATION_CACHE_TTL = float(config.get("LOCATION_CACHE_TTL") or 30)
+TABLES = [LocationDB.__tablename__]
+
+
+class LocationIdCache:
+    """
+    In-process set of the IDs of existing locations.
+
+    The whole set is loaded with one query and reloaded once it is older than its TTL. Locations
+    created or deleted through this process are added or removed immediately; IDs missing from
+    the set are looked up in the database before being reported missing, so locations created by
+    other workers are picked up without waiting for the TTL. Every local change bumps `version`,
+    and a load that raced with a change is discarded rather than overwriting it.
+
+    Attributes:
+        ttl: The number of seconds after which the set is reloaded.
+        ids: The cached location IDs.
+        version: The number of local changes made to the set.
+        expires: The monotonic time at which the set has to be reloaded.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.ids = set()
+        self.version = 0
+        self.expires = 0.0
+
+    def add(self, _id: int):
+        """
+        Records a location created by this process.
+        """
+        self.ids.add(_id)
+        self.version += 1
 
-def create_location(new_location: Location) -> int:
+    def discard(self, _id: int):
+        """
+        Records a location deleted by this process.
+        """
+        self.ids.discard(_id)
+        self.version += 1
+
+    async def existing(self, sess: AsyncSession, ids: Set[int]) -> Set[int]:
+        """
+        Checks which of the given location IDs exist.
+
+        Args:
+            sess: The database session used on a cache miss.
+            ids: The location IDs to check.
+
+        Returns:
+            The subset of the given IDs that belong to existing location records.
+        """
+        if time.monotonic() >= self.expires:
+            version = self.version
+            loaded = set(await sess.scalars(select(LocationDB.id)))
+            if version == self.version:
+                self.ids = loaded
+                self.expires = time.monotonic() + self.ttl
+        missing = ids - self.ids
+        if not missing:
+            return ids
+        version = self.version
+        found = set(
+            await sess.scalars(select(LocationDB.id).where(LocationDB.id.in_(missing)))
+        )
+        if version == self.version:
+            self.ids |= found
+        return (ids - missing) | found
+
+
+location_ids = LocationIdCache(LOCATION_ID_CACHE_TTL)
+location_cache = LRUCache(LOCATION_CACHE_SIZE, LOCATION_CACHE_TTL)
+
+
+async def create_location(sess: AsyncSession, new_location: Location) -> int:
     """
-    Creates a new location record in the database.
+    Creates a new location record in the database with a single `INSERT ... RETURNING` statement.
 
     Args:
+        sess: The database session of the current request.
         new_location: A Location object containing information about the new location.
 
     Returns:
         The ID of the newly created location record.
     """
-    sess.add(new_location)
-    sess.commit()
-    new_location_id = new_location.id
-    sess.close()
+    new_location_id = await sess.scalar(
+        insert(LocationDB).values(**new_location.model_dump()).returning(LocationDB.id)
+    )
+    await bump_versions(sess, TABLES)
+    await sess.commit()
+    location_ids.add(new_location_id)
+    location_cache.clear()
     return new_location_id
 
 
-def get_locations() -> List[dict]:
+async def get_locations(
+    sess: AsyncSession, limit: int = 100, after: str = None, versions: Versions = None
+) -> Tuple[List[dict], Optional[str]]:
     """
-    Retrieves a list of all location records from the database.
+    Retrieves a page of location records from the database, ordered by ID.
+
+    Args:
+        sess: The database session of the current request.
+        limit: The maximum number of records to return.
+        after: The cursor returned with the previous page, or None for the first page.
+        versions: The change versions the page is requested at, read from the same session; the
+            page is only served from the cache if it was cached at the same versions.
 
     Returns:
-        A list of dictionaries, each representing a location record.
+        A list of dictionaries, each representing a location record, and the cursor of the next
+        page, or None if this is the last page.
+
+    Raises:
+        InvalidCursor: If the supplied cursor is malformed.
     """
-    locations = sess.query(LocationDB).order_by(LocationDB.id).all()
-    locations_dict = []
-    for i in locations:
-        locations_dict.append(i.to_dict())
-    return locations_dict
+    key = ("page", limit, after, tuple(sorted(versions.items())) if versions else None)
+    cached = location_cache.get(key)
+    if cached is not MISSING:
+        return cached
+    version = location_cache.version
+    # plain rows rather than ORM instances: nothing is added to the identity map
+    query = select(*LocationDB.__table__.columns).order_by(LocationDB.id).limit(limit + 1)
+    if after is not None:
+        query = query.where(LocationDB.id > decode_cursor(after, int))
+    locations = [i._asdict() for i in await sess.execute(query)]
+    next_cursor = None
+    if len(locations) > limit:
+        locations = locations[:limit]
+        next_cursor = encode_cursor(locations[-1]["id"])
+    location_cache.set(key, (locations, next_cursor), version=version)
+    return locations, next_cursor
 
 
-def get_location_by_id(_id: int) -> dict:
+async def get_location_by_id(sess: AsyncSession, _id: int) -> dict:
     """
     Retrieves a specific location record by its ID.
 
     Args:
+        sess: The database session of the current request.
         _id: The ID of the location record to retrieve.
 
     Returns:
         A dictionary representing the location record, or None if no record is found.
     """
-    location = sess.query(LocationDB).filter(LocationDB.id == _id).first()
+    cached = location_cache.get(("id", _id))
+    if cached is not MISSING:
+        return cached
+    version = location_cache.version
+    location = (
+        await sess.execute(select(*LocationDB.__table__.columns).where(LocationDB.id == _id))
+    ).first()
     if location:
-        return location.to_dict()
+        location_dict = location._asdict()
+        location_cache.set(("id", _id), location_dict, version=version)
+        return location_dict
     return None
 
 
-def update_location(_id: int, updated_location: dict) -> dict:
+async def get_existing_location_ids(sess: AsyncSession, ids: Iterable[int]) -> Set[int]:
     """
-    Updates an existing location record in the database.
+    Checks which of the given location IDs exist. The check is answered from the location ID
+    cache and needs at most one query.
 
     Args:
-        _id: The ID of the location record to update.
-        updated_location: A dictionary containing updated information for the location.
+        sess: The database session of the current request.
+        ids: The location IDs to check.
 
     Returns:
-        A dictionary representing the updated location record.
+        The subset of the given IDs that belong to existing location records.
+    """
+    return await location_ids.existing(sess, set(ids))
+
+
+async def get_location_names(sess: AsyncSession) -> Dict[int, str]:
+    """
+    Retrieves the name of every location record.
+
+    Args:
+        sess: The database session of the current request.
+
+    Returns:
+        A dictionary mapping each location ID to the name of the location.
+    """
+    return dict((await sess.execute(select(LocationDB.id, LocationDB.name))).all())
+
+
+async def update_location(sess: AsyncSession, _id: int, updated_location: dict) -> dict:
     """
-    location = sess.query(LocationDB).filter(LocationDB.id == _id).first()
+    Updates an existing location record in the database with a single
+    `UPDATE ... RETURNING` statement.
 
-    if "type" in updated_location:
-        location.type = updated_location["type"]
-    if "name" in updated_location:
-        location.name = updated_location["name"]
-    if "address" in updated_location:
-        location.address = updated_location["address"]
+    Args:
+        sess: The database session of the current request.
+        _id: The ID of the location record to update.
+        updated_location: A dictionary containing updated information for the location.
 
-    sess.commit()
-    location_dict = location.to_dict()
-    sess.close()
-    return location_dict
+    Returns:
+        A dictionary representing the updated location record, or None if no record is found.
 
+    Raises:
+        IntegrityError: If the changes violate a constraint of the location table.
+    """
+    values = {k: v for k, v in updated_location.items() if k in UPDATABLE_COLUMNS}
+    if not values:
+        return await get_location_by_id(sess, _id)
+    location = (
+        await sess.execute(
+            update(LocationDB)
+            .where(LocationDB.id == _id)
+            .values(**values)
+            .returning(*LocationDB.__table__.columns)
+        )
+    ).first()
+    if location:
+        await bump_versions(sess, TABLES)
+    await sess.commit()
+    location_cache.clear()
+    if location:
+        return location._asdict()
+    return None
 
-def delete_location(_id: int) -> int:
+
+async def delete_location(sess: AsyncSession, _id: int) -> int:
     """
-    Deletes a location record from the database.
+    Deletes a location record from the database with a single `DELETE ... RETURNING` statement.
 
     Args:
+        sess: The database session of the current request.
         _id: The ID of the location record to delete.
 
     Returns:
-        The ID of the deleted location record.
+        The ID of the deleted location record, or None if no record is found.
+
+    Raises:
+        IntegrityError: If livestock were born at the location or are still there.
     """
-    location = sess.query(LocationDB).filter(LocationDB.id == _id).first()
-    sess.delete(location)
-    sess.commit()
-    sess.close()
-    return _id
+    deleted_id = await sess.scalar(
+        delete(LocationDB).where(LocationDB.id == _id).returning(LocationDB.id)
+    )
+    if deleted_id is not None:
+        await bump_versions(sess, TABLES)
+    await sess.commit()
+    if deleted_id is not None:
+        location_ids.discard(deleted_id)
+        location_cache.clear()
+    return deleted_id
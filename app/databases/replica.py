@@ -0,0 +1,229 @@
+"""
+This module routes the database reads of GET endpoints to the read replicas listed in
+`DB_REPLICA_URLS`, while every write keeps going to the primary through `get_session`.
+
+- `replica_set`: Chooses the replicas round-robin, skipping the ones that failed for
+                 `DB_REPLICA_COOLDOWN` seconds.
+- `open_read_session`: Opens a session on the next healthy replica, or on the primary when none is
+                       configured or reachable.
+- `get_read_session`: FastAPI dependency that opens one read session per request.
+- `PrimaryPinMiddleware`: Sets a cookie on the response of every request that committed a
+                          transaction on the primary, so that the client reads from the primary
+                          for the next `DB_PRIMARY_PIN_SECONDS` seconds and sees its own writes
+                          despite the replication lag. Clients that do not keep cookies are not
+                          pinned.
+
+A replica is checked every time a read session is opened on it: the connection is checked out
+(and pinged, if `DB_POOL_PRE_PING` is on) before the request uses it. A replica that fails is put
+aside for the cooldown, and the request moves on to the next one. `GET /health/` checks every
+replica as well.
+
+For local testing, point `DB_REPLICA_URLS` at a copy of the SQLite file of `DB_URL`, or run two
+PostgreSQL instances with streaming replication.
+"""
+import time
+from contextvars import ContextVar
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from fastapi import Request
+from sqlalchemy import event, exc, text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from app.config import config
+from app.databases.connection import Session, engine, replica_engines
+
+DB_REPLICA_COOLDOWN = float(config.get("DB_REPLICA_COOLDOWN") or 30)
+DB_PRIMARY_PIN_SECONDS = float(config.get("DB_PRIMARY_PIN_SECONDS") or 5)
+PIN_COOKIE = "db_primary_until"
+
+
+class ReplicaSet:
+    """
+    Round-robin chooser of the read replicas that tracks their health.
+
+    Attributes:
+        engines: The engine of every replica, by name.
+        cooldown: The number of seconds a failed replica is skipped for.
+        down_until: The monotonic time until which each failed replica is skipped, by name.
+        failures: The number of times each replica failed, by name.
+    """
+
+    def __init__(self, engines: Dict[str, AsyncEngine], cooldown: float):
+        self.engines = engines
+        self.cooldown = cooldown
+        self.down_until = {name: 0.0 for name in engines}
+        self.failures = {name: 0 for name in engines}
+        self._names = list(engines)
+        self._next = 0
+
+    def candidates(self) -> Tuple[str, ...]:
+        """
+        Returns the names of the healthy replicas, starting with the next one in turn.
+        """
+        if not self._names:
+            return ()
+        start = self._next
+        self._next = (self._next + 1) % len(self._names)
+        now = time.monotonic()
+        names = self._names[start:] + self._names[:start]
+        return tuple(name for name in names if self.down_until[name] <= now)
+
+    def mark_up(self, name: str):
+        """
+        Records that a replica answered.
+        """
+        self.down_until[name] = 0.0
+
+    def mark_down(self, name: str):
+        """
+        Records that a replica failed, skipping it for the cooldown.
+        """
+        self.failures[name] += 1
+        self.down_until[name] = time.monotonic() + self.cooldown
+
+    async def check(self) -> Dict[str, str]:
+        """
+        Runs `SELECT 1` on every replica, including those in their cooldown.
+
+        Returns:
+            The status of every replica, `ok` or `unavailable`, by name.
+        """
+        statuses = {}
+        for name, eng in self.engines.items():
+            try:
+                async with eng.connect() as conn:
+                    await conn.execute(text("SELECT 1"))
+            # pylint: disable-next=broad-exception-caught
+            except Exception:
+                self.mark_down(name)
+                statuses[name] = "unavailable"
+            else:
+                self.mark_up(name)
+                statuses[name] = "ok"
+        return statuses
+
+    def stats(self) -> Dict[str, dict]:
+        """
+        Reports the state of every replica.
+
+        Returns:
+            A dictionary with, for every replica, whether it is currently skipped, for how many
+            more seconds, and how many times it failed.
+        """
+        now = time.monotonic()
+        return {
+            name: {
+                "down": self.down_until[name] > now,
+                "down_for": max(self.down_until[name] - now, 0.0),
+                "failures": self.failures[name],
+            }
+            for name in self._names
+        }
+
+
+replica_set = ReplicaSet(replica_engines, DB_REPLICA_COOLDOWN)
+
+# the number of transactions the current request committed on the primary, in a one-item list
+primary_commits: ContextVar[Optional[List[int]]] = ContextVar("primary_commits", default=None)
+
+
+# pylint: disable-next=unused-argument
+def _count_commit(conn):
+    commits = primary_commits.get()
+    if commits is not None:
+        commits[0] += 1
+
+
+event.listen(engine.sync_engine, "commit", _count_commit)
+
+
+def is_pinned(request: Request) -> bool:
+    """
+    Checks whether the client of a request wrote recently and has to read from the primary.
+
+    Args:
+        request: The request.
+
+    Returns:
+        True if the request carries a pin cookie that has not expired. Cookies expiring further
+        than `DB_PRIMARY_PIN_SECONDS` in the future were not set by this service and are ignored.
+    """
+    try:
+        until = float(request.cookies.get(PIN_COOKIE, 0))
+    except ValueError:
+        return False
+    now = time.time()
+    return now < until <= now + DB_PRIMARY_PIN_SECONDS
+
+
+async def open_read_session(pinned: bool = False) -> AsyncSession:
+    """
+    Opens a session for reads on the next healthy replica, with its connection checked out.
+
+    Args:
+        pinned: Whether the client has to read from the primary.
+
+    Returns:
+        An AsyncSession bound to a replica, or to the primary when the client is pinned or no
+        replica is configured or reachable. The caller closes it.
+    """
+    if not pinned:
+        for name in replica_set.candidates():
+            sess = Session(bind=replica_set.engines[name])
+            try:
+                await sess.connection()
+            except (exc.SQLAlchemyError, OSError):
+                await sess.close()
+                replica_set.mark_down(name)
+                continue
+            return sess
+    return Session()
+
+
+async def get_read_session(request: Request) -> AsyncIterator[AsyncSession]:
+    """
+    Opens a read session for the duration of a single request, see `open_read_session`.
+
+    Args:
+        request: The request; its pin cookie decides whether it reads from the primary.
+
+    Yields:
+        An AsyncSession that is closed once the request has been handled. It must not be used
+        for writes.
+    """
+    async with await open_read_session(is_pinned(request)) as sess:
+        yield sess
+
+
+class PrimaryPinMiddleware:
+    """
+    ASGI middleware setting the pin cookie on the response of every request that committed on
+    the primary, when replicas are configured.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not replica_set.engines:
+            await self.app(scope, receive, send)
+            return
+        commits = [0]
+        token = primary_commits.set(commits)
+
+        async def send_with_pin(message):
+            if message["type"] == "http.response.start" and commits[0]:
+                until = time.time() + DB_PRIMARY_PIN_SECONDS
+                cookie = (
+                    f"{PIN_COOKIE}={until:.3f}; Max-Age={int(DB_PRIMARY_PIN_SECONDS) + 1}; "
+                    "Path=/; HttpOnly; SameSite=Lax"
+                )
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (b"set-cookie", cookie.encode("latin-1")),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_pin)
+        finally:
+            primary_commits.reset(token)
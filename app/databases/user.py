@@ -1,97 +1,116 @@
 """
 This module provides functions for managing user data within the application.
+
+Every write bumps the change version of the user table before committing.
 """
 from typing import List
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.databases.change_version import bump_versions
 from app.models.user import UserDB
-from app.databases.connection import sess
 from app.schemas.user import User
 
+TABLES = [UserDB.__tablename__]
+
 
-def create_user(new_user: UserDB) -> int:
+async def create_user(sess: AsyncSession, new_user: User) -> int:
     """
-    Creates a new user record in the database.
+    Creates a new user record in the database with a single `INSERT ... RETURNING` statement.
 
     Args:
-        new_user: A UserDB object containing information about the new user.
+        sess: The database session of the current request.
+        new_user: A User object containing information about the new user.
 
     Returns:
         The ID of the newly created user record.
     """
-    sess.add(new_user)
-    sess.commit()
-    new_user_id = new_user.id
-    sess.close()
+    new_user_id = await sess.scalar(
+        insert(UserDB).values(**new_user.model_dump()).returning(UserDB.id)
+    )
+    await bump_versions(sess, TABLES)
+    await sess.commit()
     return new_user_id
 
 
-def get_users() -> List[dict]:
+async def get_users(sess: AsyncSession) -> List[dict]:
     """
     Retrieves a list of all user records from the database.
 
+    Args:
+        sess: The database session of the current request.
+
     Returns:
         A list of dictionaries, each representing a user record.
     """
-    users = sess.query(UserDB).order_by(UserDB.id).all()
-    users_dict = []
-    for i in users:
-        users_dict.append(i.to_dict())
-    return users_dict
+    users = await sess.execute(select(*UserDB.__table__.columns).order_by(UserDB.id))
+    return [i._asdict() for i in users]
 
 
-def get_user_by_username(username: str) -> dict:
+async def get_user_by_username(sess: AsyncSession, username: str) -> dict:
     """
     Retrieves a specific user record by its username.
 
     Args:
+        sess: The database session of the current request.
         username: The username of the user to retrieve.
 
     Returns:
         A dictionary representing the user record, or None if no record is found.
     """
-    user = sess.query(UserDB).filter(UserDB.username == username).first()
+    user = (
+        await sess.execute(
+            select(*UserDB.__table__.columns).where(UserDB.username == username)
+        )
+    ).first()
     if user:
-        return user.to_dict()
-    return user
+        return user._asdict()
+    return None
 
 
-def update_user(_id: int, updated_user: User) -> dict:
+async def update_user(sess: AsyncSession, _id: int, updated_user: User) -> dict:
     """
-    Updates an existing user record in the database.
+    Updates an existing user record in the database with a single `UPDATE ... RETURNING`
+    statement.
 
     Args:
+        sess: The database session of the current request.
         _id: The ID of the user record to update.
         updated_user: A User object containing updated information for the user.
 
     Returns:
-        A dictionary representing the updated user record.
+        A dictionary representing the updated user record, or None if no record is found.
     """
-    user = sess.query(UserDB).filter(UserDB.id == _id).first()
-
-    user.user_name = updated_user.user_name
-    user.user_location = updated_user.user_location
-    user.number_of_barns = updated_user.number_of_barns
-    user.total_capacity = updated_user.total_capacity
-    user.owner_name = updated_user.owner_name
-    user.phone_number = updated_user.phone_number
-
-    sess.commit()
-    user_dict = user.to_dict()
-    sess.close()
-    return user_dict
+    user = (
+        await sess.execute(
+            update(UserDB)
+            .where(UserDB.id == _id)
+            .values(**updated_user.model_dump())
+            .returning(*UserDB.__table__.columns)
+        )
+    ).first()
+    if user:
+        await bump_versions(sess, TABLES)
+    await sess.commit()
+    if user:
+        return user._asdict()
+    return None
 
 
-def delete_user(_id: int) -> int:
+async def delete_user(sess: AsyncSession, _id: int) -> int:
     """
-    Deletes a user record from the database.
+    Deletes a user record from the database with a single `DELETE ... RETURNING` statement.
 
     Args:
+        sess: The database session of the current request.
         _id: The ID of the user record to delete.
 
     Returns:
-        The ID of the deleted user record.
+        The ID of the deleted user record, or None if no record is found.
     """
-    user = sess.query(UserDB).filter(UserDB.id == _id).first()
-    sess.delete(user)
-    sess.commit()
-    sess.close()
-    return _id
+    deleted_id = await sess.scalar(
+        delete(UserDB).where(UserDB.id == _id).returning(UserDB.id)
+    )
+    if deleted_id is not None:
+        await bump_versions(sess, TABLES)
+    await sess.commit()
+    return deleted_id
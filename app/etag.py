@@ -0,0 +1,101 @@
+"""
+This module answers conditional GET requests of endpoints whose response only depends on the
+contents of a few tables and on the request URL.
+
+The ETag of such a response is derived from the change versions of its tables (see
+`app.databases.change_version`) that the response was read at, and from its path and query string.
+A client sending back the tag of the current versions in `If-None-Match` gets a `304 Not Modified`
+as soon as the versions are read, one primary key lookup, before the endpoint runs its query or
+serializes anything.
+
+The versions are read before the endpoint reads its data, from the same session, and writes bump
+them in the same transaction as their changes, so a write racing with a request (or a replica
+lagging behind the primary) can only cause an extra full response, never a stale one being
+confirmed. Endpoints serving a body from an in-process cache tag it with the versions stored with
+the cached entry, not with the current ones: an outdated body keeps its own tag and is never
+confirmed by a 304.
+"""
+import hashlib
+from typing import AsyncIterator, Callable
+from fastapi import Depends, HTTPException, Request, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.auth.jwt import get_user
+from app.databases.change_version import Versions, get_versions
+from app.databases.replica import get_read_session
+
+
+def _matches(if_none_match: str, tag: str) -> bool:
+    """
+    Checks an `If-None-Match` header against an ETag, with the weak comparison of RFC 9110.
+    """
+    if if_none_match.strip() == "*":
+        return True
+    opaque = tag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == opaque for candidate in if_none_match.split(",")
+    )
+
+
+# pylint: disable-next=too-few-public-methods
+class Conditional:
+    """
+    The change versions read for a conditional request, and the ETags of the responses derived
+    from them.
+
+    Attributes:
+        request: The request.
+        versions: The current versions of the tables the response is derived from.
+    """
+
+    def __init__(self, request: Request, versions: Versions):
+        self.request = request
+        self.versions = versions
+
+    def tag(self, versions: Versions = None) -> str:
+        """
+        Returns the ETag of the response read at the given versions, by default the current ones.
+        """
+        versions = self.versions if versions is None else versions
+        key = repr((sorted(versions.items()), self.request.url.path, self.request.url.query))
+        return f'W/"{hashlib.sha1(key.encode()).hexdigest()}"'
+
+
+def etag(
+    *tables: str, session: Callable[..., AsyncIterator[AsyncSession]] = get_read_session
+):
+    """
+    Creates a dependency reading the versions of the tables an endpoint reads, and answering
+    `304 Not Modified` when the client already has the response of the current versions.
+
+    The endpoint sets the `ETag` header of its response itself, with `Conditional.tag`: without
+    arguments when it reads its data after the dependency, with the versions stored with the
+    cached entry when it serves one.
+
+    Args:
+        tables: The names of the tables the response is derived from.
+        session: The dependency opening the session the endpoint reads with, so that the versions
+            come from the same database as the data.
+
+    Returns:
+        A FastAPI dependency returning the `Conditional` of the request.
+
+    Raises:
+        HTTPException 304: If the `If-None-Match` header of the request matches the ETag of the
+        current versions.
+    """
+
+    async def dependency(
+        request: Request,
+        sess: AsyncSession = Depends(session),
+        # authenticate first, so that a 304 is only given to a client allowed to read the data
+        _: str = Depends(get_user),
+    ) -> Conditional:
+        conditional = Conditional(request, await get_versions(sess, tables))
+        tag = conditional.tag()
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None and _matches(if_none_match, tag):
+            raise HTTPException(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": tag})
+        return conditional
+
+    return dependency
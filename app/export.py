@@ -0,0 +1,174 @@
+"""
+This module encodes streamed livestock batches into bulk export formats.
+
+Each writer consumes the batches produced by `app.databases.livestock.stream_livestocks` and
+yields encoded bytes as soon as a batch has been written, so memory use is bounded by the batch
+size rather than by the size of the table:
+
+- `csv`: Comma-separated values with a header row.
+- `arrow`: The Arrow IPC streaming format, one record batch per database batch.
+- `parquet`: A Parquet file, one row group per database batch.
+
+pyarrow is only imported when a columnar format is requested.
+"""
+import csv
+import io
+from typing import AsyncIterator, List, Sequence
+
+
+class _ChunkSink:
+    """
+    Write-only file object that collects what pyarrow writes until it is drained.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        """
+        Appends written bytes to the pending chunks.
+        """
+        chunk = bytes(data)
+        self.chunks.append(chunk)
+        self.position += len(chunk)
+        return len(chunk)
+
+    def tell(self) -> int:
+        """
+        Returns the number of bytes written so far.
+        """
+        return self.position
+
+    def flush(self):
+        """
+        Does nothing; the chunks are handed out by `drain`.
+        """
+
+    def close(self):
+        """
+        Marks the sink as closed.
+        """
+        self.closed = True
+
+    def drain(self) -> bytes:
+        """
+        Returns and forgets the bytes written since the previous call.
+        """
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _arrow_schema():
+    # pylint: disable-next=import-outside-toplevel
+    import pyarrow as pa
+
+    return pa.schema(
+        [
+            ("id", pa.string()),
+            ("name", pa.string()),
+            ("breed", pa.string()),
+            ("species", pa.string()),
+            ("birthplace_id", pa.int64()),
+            ("birthdate", pa.timestamp("us")),
+            ("gender", pa.string()),
+            ("location_id", pa.int64()),
+            ("external_id", pa.string()),
+        ]
+    )
+
+
+def _record_batch(schema, columns: Sequence[str], rows: List[tuple]):
+    # pylint: disable-next=import-outside-toplevel
+    import pyarrow as pa
+
+    values = dict(zip(columns, zip(*rows)))
+    values["id"] = [str(i) for i in values["id"]]
+    return pa.record_batch(
+        [pa.array(values[field.name], type=field.type) for field in schema],
+        schema=schema,
+    )
+
+
+async def write_csv(
+    batches: AsyncIterator[List[tuple]], columns: Sequence[str]
+) -> AsyncIterator[bytes]:
+    """
+    Encodes batches of rows as CSV.
+
+    Args:
+        batches: The batches of row tuples to encode.
+        columns: The column names, in the order of the row tuples.
+
+    Yields:
+        The header row, then the encoded rows of each batch.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue().encode()
+    async for rows in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+
+
+async def write_arrow(
+    batches: AsyncIterator[List[tuple]], columns: Sequence[str]
+) -> AsyncIterator[bytes]:
+    """
+    Encodes batches of rows in the Arrow IPC streaming format.
+
+    Args:
+        batches: The batches of row tuples to encode.
+        columns: The column names, in the order of the row tuples.
+
+    Yields:
+        The stream schema, one record batch per input batch, then the end-of-stream marker.
+    """
+    # pylint: disable-next=import-outside-toplevel
+    import pyarrow as pa
+
+    schema = _arrow_schema()
+    sink = _ChunkSink()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        async for rows in batches:
+            writer.write_batch(_record_batch(schema, columns, rows))
+            yield sink.drain()
+    yield sink.drain()
+
+
+async def write_parquet(
+    batches: AsyncIterator[List[tuple]], columns: Sequence[str]
+) -> AsyncIterator[bytes]:
+    """
+    Encodes batches of rows as a Parquet file.
+
+    Args:
+        batches: The batches of row tuples to encode.
+        columns: The column names, in the order of the row tuples.
+
+    Yields:
+        One row group per input batch, then the file footer.
+    """
+    # pylint: disable-next=import-outside-toplevel
+    import pyarrow.parquet as pq
+
+    schema = _arrow_schema()
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema, compression="zstd") as writer:
+        async for rows in batches:
+            writer.write_batch(_record_batch(schema, columns, rows))
+            yield sink.drain()
+    yield sink.drain()
+
+
+# format -> (writer, media type, file extension)
+EXPORT_FORMATS = {
+    "csv": (write_csv, "text/csv", "csv"),
+    "arrow": (write_arrow, "application/vnd.apache.arrow.stream", "arrows"),
+    "parquet": (write_parquet, "application/vnd.apache.parquet", "parquet"),
+}
@@ -0,0 +1,149 @@
+"""
+This module caches livestock forecasts per scope: all locations (scope None) or a single location
+ID.
+
+A cached forecast is reused until a livestock write touches its scope, as tracked by
+`app.databases.livestock.livestock_versions`, or until `FORECAST_CACHE_TTL` seconds have passed.
+The TTL bounds how long this worker keeps serving a forecast that is outdated by writes made in
+other worker processes.
+
+With `FORECAST_STALE_WHILE_REVALIDATE` enabled, a reader that finds an outdated forecast gets it
+right away while a single background task recomputes it; only a scope that has never been
+computed makes its reader wait.
+
+Every forecast is stored with the change versions of `FORECAST_TABLES` read before it was
+computed, and returned with them, so that its ETag describes the forecast actually served. A
+reader that already read the current versions also treats a forecast computed at other versions
+as outdated: this is how writes made by other workers are noticed before the TTL. The versions
+cover whole tables, so such a write outdates the forecasts of every scope.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.cache import LRUCache
+from app.config import config
+import app.databases.headcount as db_hc
+import app.databases.livestock as db_li
+from app.databases.change_version import Versions, get_versions
+from app.databases.connection import Session
+from app.databases.livestock import livestock_versions
+
+FORECAST_CACHE_SIZE = int(config.get("FORECAST_CACHE_SIZE") or 1024)
+FORECAST_CACHE_TTL = float(config.get("FORECAST_CACHE_TTL") or 600)
+FORECAST_STALE_WHILE_REVALIDATE = (
+    config.get("FORECAST_STALE_WHILE_REVALIDATE") or "false"
+).lower() == "true"
+
+# forecasts only read the headcount rollup, which every livestock write and rebuild changes
+FORECAST_TABLES = (*db_li.TABLES, *db_hc.TABLES)
+
+logger = logging.getLogger(__name__)
+
+Compute = Callable[[AsyncSession, Optional[int]], Awaitable[dict]]
+
+
+class ForecastCache:
+    """
+    Cache of computed forecasts, keyed by scope.
+
+    Attributes:
+        entries: The cached forecasts, as (scope version, expiry time, change versions, forecast)
+            tuples.
+        ttl: The number of seconds a forecast is reused for at most.
+        stale_while_revalidate: Whether outdated forecasts are served while they are recomputed.
+        stale: The number of outdated forecasts served.
+        refreshes: The number of forecasts recomputed in the background.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, stale_while_revalidate: bool):
+        self.entries = LRUCache(maxsize)
+        self.ttl = ttl
+        self.stale_while_revalidate = stale_while_revalidate
+        self.stale = 0
+        self.refreshes = 0
+        self._refreshing: Dict[Optional[int], asyncio.Task] = {}
+
+    async def get(
+        self,
+        sess: AsyncSession,
+        scope: Optional[int],
+        compute: Compute,
+        versions: Versions = None,
+    ) -> Tuple[dict, Versions]:
+        """
+        Returns the forecast of a scope, computing it if it is missing or outdated.
+
+        Args:
+            sess: The database session of the current request.
+            scope: The location ID to forecast, or None for all locations.
+            compute: The coroutine function computing a forecast from a session and a scope.
+            versions: The change versions of `FORECAST_TABLES` already read with the session, if
+                any. A cached forecast computed at other versions is outdated.
+
+        Returns:
+            The forecast of the scope, and the change versions it was computed at.
+        """
+        entry = self.entries.get(scope, None)
+        if entry is not None:
+            version, expires, forecast_versions, forecast = entry
+            if (
+                version == livestock_versions.get(scope)
+                and expires > time.monotonic()
+                and versions in (None, forecast_versions)
+            ):
+                return forecast, forecast_versions
+            if self.stale_while_revalidate:
+                self.stale += 1
+                self._refresh(scope, compute)
+                return forecast, forecast_versions
+        return await self._compute(sess, scope, compute, versions)
+
+    async def _compute(
+        self,
+        sess: AsyncSession,
+        scope: Optional[int],
+        compute: Compute,
+        versions: Versions = None,
+    ) -> Tuple[dict, Versions]:
+        # read the versions first, so that a write committed meanwhile outdates the result
+        version = livestock_versions.get(scope)
+        if versions is None:
+            versions = await get_versions(sess, FORECAST_TABLES)
+        forecast = await compute(sess, scope)
+        self.entries.set(scope, (version, time.monotonic() + self.ttl, versions, forecast))
+        return forecast, versions
+
+    def _refresh(self, scope: Optional[int], compute: Compute):
+        if scope in self._refreshing:
+            return
+
+        async def refresh():
+            try:
+                async with Session() as sess:
+                    await self._compute(sess, scope, compute)
+                self.refreshes += 1
+            except Exception:  # pylint: disable=broad-exception-caught
+                logger.exception("Refreshing the forecast of scope %s failed", scope)
+            finally:
+                del self._refreshing[scope]
+
+        self._refreshing[scope] = asyncio.create_task(refresh())
+
+    def stats(self) -> dict:
+        """
+        Reports the cache statistics, including stale reads and background refreshes.
+        """
+        return {
+            **self.entries.stats(),
+            "stale": self.stale,
+            "refreshes": self.refreshes,
+            "refreshing": len(self._refreshing),
+        }
+
+
+forecast_cache = ForecastCache(
+    FORECAST_CACHE_SIZE, FORECAST_CACHE_TTL, FORECAST_STALE_WHILE_REVALIDATE
+)
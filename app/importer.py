@@ -0,0 +1,241 @@
+"""
+This module imports herd registries from CSV files into the livestock table.
+
+The file is read as a stream in batches. Each batch is parsed and validated against the
+`Livestock` schema in a worker thread, its locations are resolved by ID or by name, and its valid
+rows are loaded with `COPY FROM STDIN` on PostgreSQL (batched `executemany` on SQLite) and
+committed. Invalid rows are handed to a reject callback together with the reason they were
+rejected.
+
+The expected columns are `name`, `breed`, `species`, `birthdate`, `gender`, `location` and
+`birthplace` (or `location_id` and `birthplace_id`), plus an optional `external_id`. Locations
+may be given by ID or by name.
+
+Usage:
+    python -m app.importer herd.csv --rejects herd.rejects.csv
+"""
+import argparse
+import asyncio
+import csv
+import sys
+import uuid
+from datetime import datetime, time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import app.databases.livestock as db_li
+import app.databases.location as db_lo
+from app.databases.connection import Session, engine
+from app.schemas.livestock import Livestock
+
+IMPORT_BATCH_SIZE = 5000
+EXTERNAL_ID = db_li.LIVESTOCK_COLUMNS.index("external_id")
+LOCATION_ID = db_li.LIVESTOCK_COLUMNS.index("location_id")
+
+RejectCallback = Callable[[int, dict, str], None]
+
+
+# pylint: disable-next=too-few-public-methods
+class LocationResolver:
+    """
+    Resolves the location column values of an import file to location IDs.
+
+    Attributes:
+        ids: The IDs of all existing locations.
+        by_name: The ID of each location name, or None if several locations share the name.
+    """
+
+    def __init__(self, names: Dict[int, str]):
+        self.ids = set(names)
+        self.by_name = {}
+        for _id, name in names.items():
+            self.by_name[name] = None if name in self.by_name else _id
+
+    def resolve(self, value: Optional[str]) -> int:
+        """
+        Resolves a location given by ID or by name.
+
+        Args:
+            value: The value of the location column.
+
+        Returns:
+            The ID of the location.
+
+        Raises:
+            ValueError: If the location does not exist or its name is ambiguous.
+        """
+        value = (value or "").strip()
+        if value.isdigit() and int(value) in self.ids:
+            return int(value)
+        if value not in self.by_name:
+            raise ValueError(f"Unknown location '{value}'")
+        if self.by_name[value] is None:
+            raise ValueError(f"Ambiguous location name '{value}'")
+        return self.by_name[value]
+
+
+def _read_rows(lines: Iterable[str]) -> Iterator[Tuple[int, dict]]:
+    """
+    Reads the rows of a CSV file with the number of the line each of them starts on, which runs
+    ahead of the row count once a quoted field spans several lines or blank lines are skipped.
+    """
+    # the numbers of the non-blank lines read since the previous row
+    numbers = []
+
+    def numbered() -> Iterator[str]:
+        for number, line in enumerate(lines, start=1):
+            if line.strip("\r\n"):
+                numbers.append(number)
+            yield line
+
+    reader = csv.DictReader(numbered())
+    if reader.fieldnames is None:
+        return
+    numbers.clear()
+    for row in reader:
+        yield numbers[0], row
+        numbers.clear()
+
+
+def _prepare_batch(
+    rows: Iterator[Tuple[int, dict]], size: int, locations: LocationResolver
+) -> Tuple[int, List[Tuple[int, dict, tuple]], List[Tuple[int, dict, str]]]:
+    """
+    Reads and validates the next batch of rows. Runs in a worker thread.
+
+    Returns:
+        The number of rows read, the valid rows with their line number, the raw row and the
+        record in the order of `LIVESTOCK_COLUMNS`, and the rejected rows with their line number,
+        the raw row and the reason.
+    """
+    read = 0
+    valid = []
+    rejects = []
+    for line, row in rows:
+        read += 1
+        try:
+            data = dict(row)
+            data["location_id"] = locations.resolve(
+                row.get("location_id", row.get("location"))
+            )
+            data["birthplace_id"] = locations.resolve(
+                row.get("birthplace_id", row.get("birthplace"))
+            )
+            data["external_id"] = row.get("external_id") or None
+            livestock = Livestock.model_validate(data)
+        except (ValidationError, ValueError) as exc:
+            rejects.append((line, row, str(exc)))
+        else:
+            record = livestock.model_dump()
+            record["id"] = uuid.uuid4()
+            record["birthdate"] = datetime.combine(livestock.birthdate, time())
+            valid.append((line, row, tuple(record[i] for i in db_li.LIVESTOCK_COLUMNS)))
+        if read == size:
+            break
+    return read, valid, rejects
+
+
+async def _load_batch(
+    sess: AsyncSession,
+    valid: List[Tuple[int, dict, tuple]],
+    rejects: List[Tuple[int, dict, str]],
+    seen: set,
+) -> int:
+    """
+    Loads the valid rows of a batch and commits them. Rows whose external ID already exists, in
+    the database or earlier in the file, are added to the rejects instead.
+
+    Returns:
+        The number of rows loaded.
+    """
+    # COPY cannot skip conflicting rows, so external IDs that already exist are rejected here
+    duplicates = seen | await db_li.get_existing_external_ids(
+        sess, {i[EXTERNAL_ID] for _, _, i in valid if i[EXTERNAL_ID] is not None}
+    )
+    records = []
+    for line, row, record in valid:
+        external_id = record[EXTERNAL_ID]
+        if external_id is not None and external_id in duplicates:
+            rejects.append((line, row, f"Duplicate external ID '{external_id}'"))
+            continue
+        if external_id is not None:
+            seen.add(external_id)
+            duplicates.add(external_id)
+        records.append(record)
+    if records:
+        await db_li.load_livestocks(sess, records)
+        await sess.commit()
+        db_li.livestock_versions.bump(i[LOCATION_ID] for i in records)
+    return len(records)
+
+
+async def import_livestocks(
+    sess: AsyncSession,
+    lines: Iterable[str],
+    on_reject: RejectCallback,
+    batch_size: int = IMPORT_BATCH_SIZE,
+) -> dict:
+    """
+    Imports livestock records from the lines of a CSV file, committing after every batch.
+
+    Args:
+        sess: The database session to write with.
+        lines: The lines of the CSV file, starting with the header row.
+        on_reject: Called with the line number, the raw row and the reason of each rejected row.
+        batch_size: The number of rows validated and loaded at once.
+
+    Returns:
+        A dictionary with the number of imported and rejected rows.
+    """
+    locations = LocationResolver(await db_lo.get_location_names(sess))
+    rows = _read_rows(lines)
+    seen = set()
+    imported = 0
+    rejected = 0
+    while True:
+        read, valid, rejects = await asyncio.to_thread(
+            _prepare_batch, rows, batch_size, locations
+        )
+        imported += await _load_batch(sess, valid, rejects, seen)
+        rejected += len(rejects)
+        # duplicates are found after validation; report the rejects of the batch in file order
+        for line, row, reason in sorted(rejects, key=lambda i: i[0]):
+            on_reject(line, row, reason)
+        if read < batch_size:
+            return {"imported": imported, "rejected": rejected}
+
+
+async def main(argv: List[str] = None):
+    """
+    Imports a CSV file from the command line and writes the rejected rows to a reject file.
+    """
+    parser = argparse.ArgumentParser(description="Import livestock records from a CSV file.")
+    parser.add_argument("file", help="the CSV file to import")
+    parser.add_argument(
+        "--rejects", help="where to write rejected rows (default: <file>.rejects.csv)"
+    )
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    with open(args.file, newline="", encoding="utf-8") as source, open(
+        args.rejects or f"{args.file}.rejects.csv", "w", newline="", encoding="utf-8"
+    ) as rejects:
+        writer = csv.writer(rejects)
+
+        def on_reject(line: int, row: dict, reason: str):
+            if rejects.tell() == 0:
+                writer.writerow(["line", "error", *row.keys()])
+            writer.writerow([line, reason, *row.values()])
+
+        try:
+            async with Session() as sess:
+                report = await import_livestocks(sess, source, on_reject, args.batch_size)
+        finally:
+            await engine.dispose()
+    print(f"Imported {report['imported']} rows, rejected {report['rejected']} rows")
+    return report
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1:]))
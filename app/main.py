@@ -8,8 +8,13 @@ and includes routers for different functionalities:
 - Location management
 - Livestock management
 - Prediction generation
+- Service health
+- Prometheus metrics
+- Request profiles
 
 """
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, status
 from fastapi.encoders import jsonable_encoder
 from fastapi.exceptions import RequestValidationError
@@ -17,12 +22,42 @@ from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
+from app.config import config
+from app.databases.connection import engine, replica_engines
+from app.databases.replica import PrimaryPinMiddleware
 from app.routes.users import user_router
 from app.routes.locations import location_router
 from app.routes.livestocks import livestock_router
-from app.routes.predicts import predict_router
+from app.routes.predicts import predict_router, warm_up
+from app.routes.health import health_router
+from app.routes.metrics import metrics_router
+from app.routes.profiles import profile_router
+from app.metrics import MetricsMiddleware
+from app.profiling import ProfilingMiddleware
 
-app = FastAPI()
+# load the prediction libraries in the background once the server has started (true/false)
+PREDICT_WARM_UP = (config.get("PREDICT_WARM_UP") or "false").lower() == "true"
+
+
+@asynccontextmanager
+# pylint: disable-next=redefined-outer-name
+async def lifespan(app: FastAPI):
+    """
+    Runs the startup and shutdown steps of the application.
+
+    Args:
+        app: The application instance.
+    """
+    if PREDICT_WARM_UP:
+        # runs while the server starts listening; requests are served in the meantime
+        app.state.warm_up = asyncio.create_task(asyncio.to_thread(warm_up))
+    yield
+    await engine.dispose()
+    for replica in replica_engines.values():
+        await replica.dispose()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -31,6 +66,10 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=[""],
 )
+# the metrics middleware wraps the profiler, which reads the statistics of the request
+app.add_middleware(PrimaryPinMiddleware)
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 
 @app.exception_handler(RequestValidationError)
@@ -79,6 +118,9 @@ app.include_router(user_router)
 app.include_router(location_router, prefix="/locations")
 app.include_router(livestock_router, prefix="/livestocks")
 app.include_router(predict_router, prefix="/predicts")
+app.include_router(health_router, prefix="/health")
+app.include_router(metrics_router)
+app.include_router(profile_router, prefix="/profiles")
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=80, reload=True)
@@ -0,0 +1,337 @@
+"""
+This module collects the request and database metrics of the application and renders them in the
+Prometheus text exposition format.
+
+- `MetricsMiddleware`: ASGI middleware counting requests per route template, method and status
+  code, and recording their latency.
+- `instrument_engine`: Hooks SQLAlchemy cursor events of an engine to time every statement and
+  attribute it to the request that ran it.
+- `timed`: Records the duration of a section of work, such as password hashing, a forecast fit or
+  response serialization, so that a slow route can be broken down.
+- `render`: Returns every metric as Prometheus text, served on `/metrics`.
+
+Metrics are kept per worker process; Prometheus sums them across workers.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# every metric created, in the order they are rendered
+REGISTRY = []
+
+
+class Metric:
+    """
+    Base class of the metrics, holding their name, help text and label names.
+    """
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        REGISTRY.append(self)
+
+    def _labels(self, labels: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [
+            f'{name}="{_escape(str(value))}"' for name, value in zip(self.labelnames, labels)
+        ]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def samples(self) -> Iterator[str]:
+        """
+        Yields the exposition lines of the samples of the metric.
+        """
+        raise NotImplementedError
+
+    def render(self) -> str:
+        """
+        Returns the metric in the Prometheus text exposition format.
+        """
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+            *self.samples(),
+        ]
+        return "\n".join(lines) + "\n"
+
+
+class Counter(Metric):
+    """
+    Monotonically increasing value per label set.
+    """
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        """
+        Increments the value of a label set.
+        """
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self) -> Iterator[str]:
+        for labels, value in self.values.items():
+            yield f"{self.name}{self._labels(labels)} {value}"
+
+
+class Gauge(Metric):
+    """
+    Value per label set that is set to its current value, typically right before rendering.
+    """
+
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, *labels: str):
+        """
+        Sets the value of a label set.
+        """
+        self.values[labels] = value
+
+    def samples(self) -> Iterator[str]:
+        for labels, value in self.values.items():
+            yield f"{self.name}{self._labels(labels)} {value}"
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values per label set, counted in cumulative buckets.
+    """
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DURATION_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # label set -> [count per bucket (non-cumulative, the last one is +Inf), sum]
+        self.values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str):
+        """
+        Records a value for a label set.
+        """
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        entry[0][index] += 1
+        entry[1] += value
+
+    def samples(self) -> Iterator[str]:
+        for labels, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                bucket = self._labels(labels, f'le="{bound}"')
+                yield f"{self.name}_bucket{bucket} {cumulative}"
+            yield f"{self.name}_sum{self._labels(labels)} {total}"
+            yield f"{self.name}_count{self._labels(labels)} {cumulative}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+http_requests = Counter(
+    "http_requests_total",
+    "Number of HTTP requests handled.",
+    ("method", "route", "status"),
+)
+http_request_duration = Histogram(
+    "http_request_duration_seconds",
+    "Time spent handling HTTP requests, until the response was sent.",
+    ("method", "route"),
+)
+http_request_db_statements = Histogram(
+    "http_request_db_statements",
+    "Number of database statements executed per HTTP request.",
+    ("method", "route"),
+    buckets=STATEMENT_BUCKETS,
+)
+http_request_db_duration = Histogram(
+    "http_request_db_duration_seconds",
+    "Time spent executing database statements per HTTP request.",
+    ("method", "route"),
+)
+db_statement_duration = Histogram(
+    "db_statement_duration_seconds",
+    "Time spent executing single database statements.",
+    ("engine",),
+)
+section_duration = Histogram(
+    "section_duration_seconds",
+    "Time spent in instrumented sections of work, such as password hashing, forecast fits "
+    "and response serialization.",
+    ("section",),
+)
+db_pool_connections = Gauge(
+    "db_pool_connections",
+    "Number of connections of the database pool, by state.",
+    ("engine", "state"),
+)
+db_pool_timeouts = Counter(
+    "db_pool_timeouts_total",
+    "Number of database pool checkouts that timed out.",
+    ("engine",),
+)
+password_hash_pending = Gauge(
+    "password_hash_pending",
+    "Number of password hashing operations queued or running.",
+)
+
+
+# pylint: disable-next=too-few-public-methods
+class RequestStats:
+    """
+    Statistics of the request being handled, shared by the middleware and the engine hooks.
+
+    Attributes:
+        scope: The ASGI scope of the request; it holds the matched route once routing is done.
+        statements: The number of database statements executed so far.
+        db_time: The number of seconds spent executing them.
+        budget: The number of statements the request may execute, or None for the default.
+        repeat_limit: How often the request may execute the same statement, or None for the
+            default.
+        shapes: How often each statement was executed.
+        flagged: The problems already reported for the request.
+    """
+
+    __slots__ = (
+        "scope",
+        "statements",
+        "db_time",
+        "budget",
+        "repeat_limit",
+        "shapes",
+        "flagged",
+    )
+
+    def __init__(self, scope: dict):
+        self.scope = scope
+        self.statements = 0
+        self.db_time = 0.0
+        self.budget = None
+        self.repeat_limit = None
+        self.shapes = {}
+        self.flagged = set()
+
+    @property
+    def route(self) -> str:
+        """
+        Returns the path template of the matched route, or `unmatched`.
+        """
+        route = self.scope.get("route")
+        return getattr(route, "path", "unmatched")
+
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar(
+    "current_request", default=None
+)
+
+
+# pylint: disable-next=too-few-public-methods
+class MetricsMiddleware:
+    """
+    ASGI middleware recording the count, status and latency of every HTTP request, labelled with
+    the path template of its route (e.g. `/livestocks/{_id}`) to keep the number of series bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats(scope)
+        token = current_request.set(stats)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            current_request.reset(token)
+            method, route = scope["method"], stats.route
+            http_requests.inc(method, route, str(status))
+            http_request_duration.observe(time.perf_counter() - start, method, route)
+            http_request_db_statements.observe(stats.statements, method, route)
+            http_request_db_duration.observe(stats.db_time, method, route)
+
+
+def instrument_engine(engine: AsyncEngine, name: str = "primary"):
+    """
+    Times every statement executed by an engine and adds it to the statistics of the current
+    request.
+
+    Args:
+        engine: The engine to instrument.
+        name: The value of the `engine` label of its statements.
+    """
+
+    # pylint: disable-next=unused-argument,too-many-arguments
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context.metrics_start = time.perf_counter()
+
+    # pylint: disable-next=unused-argument,too-many-arguments
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context.metrics_start
+        db_statement_duration.observe(elapsed, name)
+        stats = current_request.get()
+        if stats is not None:
+            stats.statements += 1
+            stats.db_time += elapsed
+
+    event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", after_cursor_execute)
+
+
+@contextmanager
+def timed(section: str):
+    """
+    Records the duration of the enclosed block under the given section name.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        section_duration.observe(time.perf_counter() - start, section)
+
+
+def render() -> str:
+    """
+    Returns every registered metric in the Prometheus text exposition format.
+    """
+    return "".join(metric.render() for metric in REGISTRY)
@@ -1,6 +1,6 @@
 """
-This module defines the SQLAlchemy models used to manage location and livestock data within the
-application.
+This module defines the SQLAlchemy models used to manage location and livestock data, the
+livestock headcount rollup and the change versions of the tables, within the application.
 """
 import uuid
 import sqlalchemy as sa
@@ -57,6 +57,7 @@ class LivestockDB(Base):
         birthdate: The date of birth of the livestock.
         gender: The gender of the livestock (male, female).
         location_id: The foreign key referencing the current location.
+        external_id: An optional identifier supplied by the client, unique across all livestock.
 
     Relationships:
         birthplace: The LocationDB object representing the birthplace.
@@ -64,19 +65,23 @@ class LivestockDB(Base):
     """
 
     __tablename__ = "livestock"
+    __table_args__ = (
+        sa.Index("ix_livestock_location_id_species", "location_id", "species"),
+    )
     # id = mapped_column(sa.Integer, primary_key=True)
-    id = mapped_column(sa.UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = mapped_column(sa.Uuid(as_uuid=True), primary_key=True, default=uuid.uuid4)
     name = mapped_column(sa.String(50), nullable=False)
     breed = mapped_column(sa.String(50), nullable=False)
     species = mapped_column(sa.String(50), nullable=False)
     birthplace_id = mapped_column(
-        sa.Integer, sa.ForeignKey("location.id"), nullable=False
+        sa.Integer, sa.ForeignKey("location.id"), nullable=False, index=True
     )
-    birthdate = mapped_column(sa.DateTime, nullable=False)
+    birthdate = mapped_column(sa.DateTime, nullable=False, index=True)
     gender = mapped_column(sa.Enum("male", "female"), nullable=False)
     location_id = mapped_column(
         sa.Integer, sa.ForeignKey("location.id"), nullable=False
     )
+    external_id = mapped_column(sa.String(64), unique=True)
 
     birthplace = relationship("LocationDB", foreign_keys=[birthplace_id])
     location = relationship("LocationDB", foreign_keys=[location_id])
@@ -97,4 +102,44 @@ class LivestockDB(Base):
             "birthdate": self.birthdate,
             "gender": self.gender,
             "location_id": self.location_id,
+            "external_id": self.external_id,
         }
+
+
+# pylint: disable-next=too-few-public-methods
+class HeadcountDB(Base):
+    """
+    Represents the number of livestock currently at a location that were born in a given year.
+
+    The table is a rollup of the livestock table, kept up to date by every livestock write in the
+    same transaction. Rows whose count drops to zero are removed.
+
+    Attributes:
+        location_id: The ID of the current location of the livestock.
+        birth_year: The year the livestock were born in.
+        count: The number of livestock.
+    """
+
+    __tablename__ = "livestock_headcount"
+    location_id = mapped_column(sa.Integer, primary_key=True)
+    birth_year = mapped_column(sa.Integer, primary_key=True)
+    count = mapped_column(sa.Integer, nullable=False)
+
+
+# pylint: disable-next=too-few-public-methods
+class ChangeVersionDB(Base):
+    """
+    Represents the number of committed write transactions that changed a table.
+
+    Every write bumps the version of the tables it changes in its own transaction, so that
+    responses derived from a table can be tagged with its version and revalidated cheaply. Tables
+    that were never written have no row, which stands for version 0.
+
+    Attributes:
+        table_name: The name of the table.
+        version: The number of write transactions that changed the table.
+    """
+
+    __tablename__ = "change_version"
+    table_name = mapped_column(sa.String(64), primary_key=True)
+    version = mapped_column(sa.BigInteger, nullable=False)
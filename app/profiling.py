@@ -0,0 +1,169 @@
+"""
+This module profiles single requests with a sampling profiler, on demand or for a sample of the
+traffic, and keeps the recent profiles in memory.
+
+- An admin requests a profile by sending `X-Profile: 1` or `?profile=1`. The response carries
+  an `X-Profile-Id` header, and the profile is fetched from `GET /profiles/{id}`.
+- `PROFILE_SAMPLE_RATE` profiles that fraction of all requests in the background, for later
+  inspection.
+
+While a request is profiled, a thread samples the stack of the event loop thread every
+`PROFILE_INTERVAL` seconds. Profiles are folded stacks (`frame;frame;frame count`), as read by
+flamegraph.pl and speedscope. They cover the handler, serialization and the CPU spent issuing
+database calls. Time spent waiting for the database shows up as event loop polling, and is also
+reported as `db_time`. Requests running concurrently on the same loop appear in the samples too.
+"""
+import asyncio
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Optional
+from urllib.parse import parse_qs
+
+from app.auth.jwt import is_admin
+from app.cache import LRUCache
+from app.config import config
+from app.metrics import current_request
+
+PROFILE_SAMPLE_RATE = float(config.get("PROFILE_SAMPLE_RATE") or 0)
+PROFILE_INTERVAL = float(config.get("PROFILE_INTERVAL") or 0.005)
+PROFILE_STORE_SIZE = int(config.get("PROFILE_STORE_SIZE") or 100)
+
+profile_store = LRUCache(PROFILE_STORE_SIZE)
+
+
+class Sampler(threading.Thread):
+    """
+    Thread sampling the stack of another thread at a fixed interval.
+
+    Attributes:
+        thread_id: The identifier of the sampled thread.
+        interval: The number of seconds between samples.
+        stacks: The number of samples of each folded stack.
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(name="profiler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            # pylint: disable-next=protected-access
+            frame = sys._current_frames().get(self.thread_id)
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if frames:
+                self.stacks[";".join(reversed(frames))] += 1
+
+    def stop(self):
+        """
+        Stops sampling without waiting for the thread; join it before reading `stacks`.
+        """
+        self._done.set()
+
+    def folded(self) -> str:
+        """
+        Returns the samples as folded stacks, one line per distinct stack.
+        """
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def _headers(scope: dict) -> dict:
+    return {
+        name.decode("latin-1").lower(): value.decode("latin-1")
+        for name, value in scope["headers"]
+    }
+
+
+def _profile_requested(scope: dict) -> bool:
+    """
+    Checks whether an admin asked for the request to be profiled.
+    """
+    headers = _headers(scope)
+    flag = headers.get("x-profile")
+    if flag is None:
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        flag = query.get("profile", [None])[0]
+    if flag not in ("1", "true"):
+        return False
+    scheme, _, token = headers.get("authorization", "").partition(" ")
+    return scheme.lower() == "bearer" and is_admin(token)
+
+
+# pylint: disable-next=too-few-public-methods
+class ProfilingMiddleware:
+    """
+    ASGI middleware running requested and sampled requests under a `Sampler`.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        requested = _profile_requested(scope)
+        if not requested and not random.random() < PROFILE_SAMPLE_RATE:
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex
+        status = 500
+
+        async def send_with_profile_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if requested:
+                    message["headers"] = [
+                        *message.get("headers", []),
+                        (b"x-profile-id", profile_id.encode()),
+                    ]
+            await send(message)
+
+        sampler = Sampler(threading.get_ident(), PROFILE_INTERVAL)
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            duration = time.perf_counter() - start
+            sampler.stop()
+            # the sampler may be sleeping for up to an interval; do not block the event loop on it
+            await asyncio.to_thread(sampler.join)
+            stats = current_request.get()
+            route = getattr(scope.get("route"), "path", "unmatched")
+            profile_store.set(
+                profile_id,
+                {
+                    "id": profile_id,
+                    "requested": requested,
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "route": route,
+                    "status": status,
+                    "duration": duration,
+                    "db_statements": stats.statements if stats else None,
+                    "db_time": stats.db_time if stats else None,
+                    "interval": PROFILE_INTERVAL,
+                    "samples": sum(sampler.stacks.values()),
+                    "folded": sampler.folded(),
+                },
+            )
+
+
+def get_profile(profile_id: str) -> Optional[dict]:
+    """
+    Returns a stored profile, or None if it does not exist or was evicted.
+    """
+    return profile_store.get(profile_id, None)
@@ -0,0 +1,137 @@
+"""
+This module watches the database statements of every request for slow queries and accidental
+N+1 patterns, such as touching the lazy `birthplace` or `location` relationships of
+`LivestockDB` in a loop.
+
+- Statements slower than `SLOW_QUERY_SECONDS` are logged with their bound parameters and the route
+  of the request that ran them.
+- A request may execute `QUERY_BUDGET` statements, and the same statement at most
+  `QUERY_REPEAT_LIMIT` times. Routes that legitimately need more, such as bulk loads, declare
+  their own limits with `Depends(query_budget(...))`.
+- A request going over its limits is logged once per problem. With `QUERY_STRICT=true`, as in
+  tests, the offending statement raises `QueryBudgetExceeded` instead.
+"""
+import logging
+import math
+import time
+from typing import Optional
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.config import config
+from app.metrics import RequestStats, current_request
+
+SLOW_QUERY_SECONDS = float(config.get("SLOW_QUERY_SECONDS") or 0.5)
+QUERY_BUDGET = int(config.get("QUERY_BUDGET") or 50)
+QUERY_REPEAT_LIMIT = int(config.get("QUERY_REPEAT_LIMIT") or 10)
+QUERY_STRICT = (config.get("QUERY_STRICT") or "false").lower() == "true"
+# longest logged representation of the parameters of a statement
+MAX_PARAMETERS_LENGTH = 1000
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    """
+    Raised in strict mode when a request executes more statements than its budget allows, or the
+    same statement more often than its repeat limit allows.
+    """
+
+
+def _describe(stats: Optional[RequestStats]) -> str:
+    if stats is None:
+        return "outside of a request"
+    return f"{stats.scope['method']} {stats.route}"
+
+
+def _flag(stats: RequestStats, problem: str, message: str):
+    """
+    Reports a problem of a request once, or raises it in strict mode.
+    """
+    if QUERY_STRICT:
+        raise QueryBudgetExceeded(message)
+    if problem not in stats.flagged:
+        stats.flagged.add(problem)
+        logger.warning(message)
+
+
+def check_statement(stats: RequestStats, statement: str):
+    """
+    Counts a statement against the budget and repeat limit of a request.
+
+    Args:
+        stats: The statistics of the request, with the statement already counted.
+        statement: The SQL of the statement, with placeholders for its parameters.
+    """
+    budget = QUERY_BUDGET if stats.budget is None else stats.budget
+    if stats.statements > budget:
+        _flag(
+            stats,
+            "budget",
+            f"{_describe(stats)} executed more than {budget} statements",
+        )
+    repeat_limit = QUERY_REPEAT_LIMIT if stats.repeat_limit is None else stats.repeat_limit
+    # the SQL text identifies the shape: parameters are bound separately
+    repeats = stats.shapes[statement] = stats.shapes.get(statement, 0) + 1
+    if repeats > repeat_limit:
+        _flag(
+            stats,
+            statement,
+            f"{_describe(stats)} executed the same statement more than {repeat_limit} times, "
+            f"possibly an N+1 query: {statement}",
+        )
+
+
+def watch_engine(engine: AsyncEngine):
+    """
+    Logs the slow statements of an engine and checks every statement run during a request
+    against the query budget of that request.
+
+    Args:
+        engine: The engine to watch. Its statements must already be counted per request by
+            `app.metrics.instrument_engine`.
+    """
+
+    # pylint: disable-next=unused-argument,too-many-arguments
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context.querywatch_start = time.perf_counter()
+
+    # pylint: disable-next=unused-argument,too-many-arguments
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context.querywatch_start
+        stats = current_request.get()
+        if elapsed >= SLOW_QUERY_SECONDS:
+            logger.warning(
+                "Slow statement (%.3f s) %s: %s; parameters: %.*s",
+                elapsed,
+                _describe(stats),
+                statement,
+                MAX_PARAMETERS_LENGTH,
+                repr(parameters),
+            )
+        if stats is not None:
+            check_statement(stats, statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", after_cursor_execute)
+
+
+def query_budget(statements: Optional[int], repeats: Optional[int] = QUERY_REPEAT_LIMIT):
+    """
+    Creates a dependency that overrides the query limits of the routes declaring it.
+
+    Args:
+        statements: The number of statements a request may execute, or None for no limit.
+        repeats: How often a request may execute the same statement, or None for no limit.
+
+    Returns:
+        A FastAPI dependency applying the limits to the current request.
+    """
+
+    async def dependency():
+        stats = current_request.get()
+        if stats is not None:
+            stats.budget = math.inf if statements is None else statements
+            stats.repeat_limit = math.inf if repeats is None else repeats
+
+    return dependency
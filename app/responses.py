@@ -0,0 +1,39 @@
+"""
+This module provides the fast JSON response path used by endpoints returning many records.
+
+FastAPI normally passes a returned value through `jsonable_encoder`, validates it against the
+response model and serializes it with the standard `json` module, walking every record several
+times. Endpoints using `json_response` instead serialize their typed output straight to JSON
+bytes with a pydantic `TypeAdapter`, in a single pass. They keep declaring `response_model`, which
+then only documents the response.
+"""
+from typing import Any, Mapping
+from fastapi import Response
+from pydantic import TypeAdapter
+
+from app.metrics import timed
+
+
+def json_response(
+    adapter: TypeAdapter,
+    content: Any,
+    status_code: int = 200,
+    headers: Mapping[str, str] = None,
+) -> Response:
+    """
+    Serializes content with a type adapter into a JSON response.
+
+    Args:
+        adapter: The adapter of the output type of the content.
+        content: The value to serialize.
+        status_code: The status code of the response.
+        headers: Additional headers of the response, such as its `ETag`.
+
+    Returns:
+        A response whose body is the serialized content.
+    """
+    with timed("serialize"):
+        body = adapter.dump_json(content)
+    return Response(
+        body, status_code=status_code, headers=headers, media_type="application/json"
+    )
@@ -0,0 +1,62 @@
+"""
+This API provides functionalities to inspect the health of the service, including the database
+connection, the read replicas, the state of the connection pools, the password hashing pool and
+the in-process caches.
+"""
+import os
+import time
+from fastapi import APIRouter
+from sqlalchemy import text
+
+from app.auth.jwt import token_cache
+from app.auth.password import hash_pool
+from app.databases.connection import engine, pool_stats
+from app.databases.location import location_cache
+from app.databases.replica import replica_set
+from app.forecast import forecast_cache
+
+health_router = APIRouter(tags=["Health"])
+
+
+@health_router.get("/", response_model=dict)
+async def retrieve_health() -> dict:
+    """
+    Checks the database connection and the read replicas, and reports the pools and caches of
+    this worker.
+
+    Returns:
+        A dictionary containing the worker process ID, the database status and its round-trip
+        time in seconds, the status, health and pool statistics of every replica, the connection
+        pool and password hashing pool statistics and the cache statistics.
+    """
+    start = time.perf_counter()
+    try:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+        database = "ok"
+    # pylint: disable-next=broad-exception-caught
+    except Exception:
+        database = "unavailable"
+    database_latency = time.perf_counter() - start
+    replica_statuses = await replica_set.check()
+    replicas = replica_set.stats()
+    return {
+        "pid": os.getpid(),
+        "database": database,
+        "database_latency": database_latency,
+        "pool": pool_stats(),
+        "replicas": {
+            name: {
+                "status": status,
+                **replicas[name],
+                "pool": pool_stats(replica_set.engines[name]),
+            }
+            for name, status in replica_statuses.items()
+        },
+        "password_hashing": hash_pool.stats(),
+        "caches": {
+            "locations": location_cache.stats(),
+            "tokens": token_cache.stats(),
+            "forecasts": forecast_cache.stats(),
+        },
+    }
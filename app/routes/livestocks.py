@@ -1,27 +1,60 @@
 """
 This API provides functionalities to manage livestock records, including creating, retrieving,
-updating, and deleting records.
+updating, and deleting records, as well as importing and exporting them in bulk.
+
+Reads go to the read replicas when they are configured, see `app.databases.replica`.
 """
-from typing import List
-from fastapi import APIRouter, Body, Depends, HTTPException, status
+import codecs
+from typing import List, Literal
+from uuid import UUID
+from fastapi import (
+    APIRouter,
+    Body,
+    Depends,
+    File,
+    HTTPException,
+    Query,
+    Request,
+    UploadFile,
+    status,
+)
+from fastapi.responses import Response, StreamingResponse
+from pydantic import TypeAdapter
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 import app.databases.location as db_lo
 import app.databases.livestock as db_li
-from app.schemas.livestock import Livestock
+from app.databases.connection import get_session
+from app.databases.cursor import InvalidCursor
+from app.databases.replica import get_read_session, is_pinned, open_read_session
+from app.schemas.livestock import Livestock, LivestockFilter, LivestockPage, LivestockUpdate
 from app.auth.jwt import get_user
+from app.etag import Conditional, etag
+from app.export import EXPORT_FORMATS
+from app.importer import import_livestocks
+from app.querywatch import query_budget
+from app.responses import json_response
+
+IMPORT_REJECT_LIMIT = 1000
+
+livestock_page = TypeAdapter(LivestockPage)
 
 livestock_router = APIRouter(tags=["Livestocks"])
 
 
 @livestock_router.post("/")
 async def create_livestock(
-    livestock: Livestock = Body(...), _: str = Depends(get_user)
+    livestock: Livestock = Body(...),
+    sess: AsyncSession = Depends(get_session),
+    _: str = Depends(get_user),
 ) -> dict:
     """
     Creates a new livestock record in the database.
 
     Args:
         livestock: A Livestock object containing information about the new livestock.
+        sess: The database session of the current request.
         current_user: The currently authenticated user.
 
     Returns:
@@ -31,16 +64,14 @@ async def create_livestock(
         HTTPException 404: If the specified location IDs (birthplace or current) do not exist.
         HTTPException 500: If an error occurs while creating the livestock record.
     """
-    try:
-        db_lo.get_location_by_id(livestock.location_id)
-        db_lo.get_location_by_id(livestock.birthplace_id)
-    except Exception as exc:
+    location_ids = {livestock.location_id, livestock.birthplace_id}
+    if location_ids - await db_lo.get_existing_location_ids(sess, location_ids):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Location with supplied ID does not exist",
-        ) from exc
+        )
     try:
-        _id = db_li.create_livestock(livestock.to_db())
+        _id = await db_li.create_livestock(sess, livestock)
         return {"message": f"Livestock created successfully with ID {_id}"}
     except Exception as exc:
         raise HTTPException(
@@ -49,27 +80,182 @@ async def create_livestock(
         ) from exc
 
 
-@livestock_router.get("/", response_model=List[dict])
-async def retrieve_all_livestocks(_: str = Depends(get_user)) -> List[dict]:
+# bulk writes run a few statements per batch, as many times as there are batches
+@livestock_router.post(
+    "/bulk", response_model=List[dict], dependencies=[Depends(query_budget(None, None))]
+)
+async def create_livestocks_bulk(
+    livestocks: List[Livestock] = Body(...),
+    sess: AsyncSession = Depends(get_session),
+    _: str = Depends(get_user),
+) -> List[dict]:
     """
-    Retrieves a list of all livestock records from the database.
+    Creates or updates many livestock records at once.
+
+    Records carrying an `external_id` that already exists are updated instead of duplicated, so
+    a failed request can be retried as is.
 
     Args:
+        livestocks: A list of Livestock objects to create or update.
+        sess: The database session of the current request.
         current_user: The currently authenticated user.
 
     Returns:
-        A list of dictionaries, each representing a livestock record.
+        A list with the result of each supplied record, in the same order, containing its status
+        (`created`, `updated` or `error`) and either its ID or the reason it was rejected.
+
+    Raises:
+        HTTPException 500: If an error occurs while writing the livestock records.
     """
-    return db_li.get_livestocks()
+    try:
+        return await db_li.upsert_livestocks(sess, livestocks)
+    except Exception as exc:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to create the livestocks",
+        ) from exc
+
+
+@livestock_router.post(
+    "/import", response_model=dict, dependencies=[Depends(query_budget(None, None))]
+)
+async def import_livestocks_csv(
+    file: UploadFile = File(...),
+    sess: AsyncSession = Depends(get_session),
+    _: str = Depends(get_user),
+) -> dict:
+    """
+    Imports livestock records from an uploaded CSV file, see `app.importer` for the file layout.
+
+    Args:
+        file: The uploaded CSV file.
+        sess: The database session of the current request.
+        current_user: The currently authenticated user.
+
+    Returns:
+        A dictionary containing the number of imported and rejected rows, and the first rejected
+        rows with their line number, their values and the reason they were rejected.
+
+    Raises:
+        HTTPException 400: If the file is not valid UTF-8. The batches read before the invalid
+        bytes are kept.
+        HTTPException 500: If an error occurs while loading the livestock records.
+    """
+    rejects = []
+
+    def on_reject(line: int, row: dict, reason: str):
+        if len(rejects) < IMPORT_REJECT_LIMIT:
+            rejects.append({"line": line, "row": row, "error": reason})
+
+    try:
+        report = await import_livestocks(
+            sess, codecs.iterdecode(file.file, "utf-8-sig"), on_reject
+        )
+    except UnicodeDecodeError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"The file is not valid UTF-8: {exc.reason}",
+        ) from exc
+    except Exception as exc:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to import the livestocks",
+        ) from exc
+    return {**report, "rejects": rejects}
+
+
+@livestock_router.get("/", response_model=LivestockPage)
+async def retrieve_all_livestocks(
+    limit: int = Query(100, ge=1, le=1000),
+    after: str = None,
+    filters: LivestockFilter = Depends(),
+    sess: AsyncSession = Depends(get_read_session),
+    _: str = Depends(get_user),
+    conditional: Conditional = Depends(etag(*db_li.TABLES)),
+) -> Response:
+    """
+    Retrieves a page of livestock records from the database, optionally filtered by location,
+    species, breed, gender or birthdate range.
+
+    Args:
+        limit: The maximum number of records to return.
+        after: The `next` cursor of the previous page, or None for the first page.
+        filters: The filters the records have to match, taken from the query parameters.
+        sess: The database session of the current request.
+        current_user: The currently authenticated user.
+        conditional: The version of the livestock table, which the ETag of the response is
+            derived from.
+
+    Returns:
+        A JSON response containing the list of livestock records of this page under `items` and
+        the cursor of the next page under `next` (None on the last page).
+
+    Raises:
+        HTTPException 304: If the client already has this page, per its `If-None-Match` header.
+        HTTPException 400: If the supplied cursor is malformed.
+    """
+    try:
+        livestocks, next_cursor = await db_li.get_livestocks(sess, limit, after, filters)
+    except InvalidCursor as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid pagination cursor",
+        ) from exc
+    return json_response(
+        livestock_page,
+        {"items": livestocks, "next": next_cursor},
+        headers={"ETag": conditional.tag()},
+    )
+
+
+@livestock_router.get("/export", response_class=StreamingResponse)
+async def export_livestocks(
+    request: Request,
+    fmt: Literal["csv", "arrow", "parquet"] = Query("csv", alias="format"),
+    filters: LivestockFilter = Depends(),
+    batch_size: int = Query(10000, ge=1, le=100000),
+    _: str = Depends(get_user),
+) -> StreamingResponse:
+    """
+    Exports livestock records in bulk, streamed from a server-side cursor in batches.
+
+    Args:
+        request: The request; its pin cookie decides whether the export reads from the primary.
+        fmt: The export format: `csv`, `arrow` (Arrow IPC stream) or `parquet`.
+        filters: The filters the records have to match, taken from the query parameters.
+        batch_size: The number of rows read from the database and encoded per chunk.
+        current_user: The currently authenticated user.
+
+    Returns:
+        A streaming response with the encoded livestock records.
+    """
+    writer, media_type, extension = EXPORT_FORMATS[fmt]
+
+    async def batches():
+        # The stream outlives the request handler, so it reads with a session of its own.
+        async with await open_read_session(is_pinned(request)) as sess:
+            async for rows in db_li.stream_livestocks(sess, batch_size, filters):
+                yield rows
+
+    return StreamingResponse(
+        writer(batches(), db_li.LIVESTOCK_COLUMNS),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="livestock.{extension}"'
+        },
+    )
 
 
 @livestock_router.get("/{_id}", response_model=dict)
-async def retrieve_livestock(_id: int, _: str = Depends(get_user)) -> dict:
+async def retrieve_livestock(
+    _id: UUID, sess: AsyncSession = Depends(get_read_session), _: str = Depends(get_user)
+) -> dict:
     """
     Retrieves a specific livestock record by its ID.
 
     Args:
         _id: The ID of the livestock record to retrieve.
+        sess: The database session of the current request.
         current_user: The currently authenticated user.
 
     Returns:
@@ -78,7 +264,7 @@ async def retrieve_livestock(_id: int, _: str = Depends(get_user)) -> dict:
     Raises:
         HTTPException 404: If the livestock record with the given ID is not found.
     """
-    livestock = db_li.get_livestock_by_id(_id)
+    livestock = await db_li.get_livestock_by_id(sess, _id)
     if livestock is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -89,39 +275,60 @@ async def retrieve_livestock(_id: int, _: str = Depends(get_user)) -> dict:
 
 @livestock_router.patch("/{_id}", response_model=dict)
 async def update_livestock(
-    _id: int, updated_livestock: dict = Body(...), _: str = Depends(get_user)
+    _id: UUID,
+    updated_livestock: LivestockUpdate = Body(...),
+    sess: AsyncSession = Depends(get_session),
+    _: str = Depends(get_user),
 ) -> dict:
     """
     Updates an existing livestock record in the database.
 
     Args:
         _id: The ID of the livestock record to update.
-        updated_livestock: A dictionary containing updated information for the livestock.
+        updated_livestock: A LivestockUpdate object containing the fields to change.
+        sess: The database session of the current request.
         current_user: The currently authenticated user.
 
     Returns:
         A dictionary containing a success message.
 
     Raises:
-        HTTPException 404: If the livestock record with the given ID is not found.
+        HTTPException 404: If the livestock record with the given ID is not found, or if the
+        specified location IDs (birthplace or current) do not exist.
     """
+    values = updated_livestock.model_dump(exclude_none=True)
+    location_ids = {values[i] for i in ("location_id", "birthplace_id") if i in values}
+    if location_ids - await db_lo.get_existing_location_ids(sess, location_ids):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Location with supplied ID does not exist",
+        )
     try:
-        db_li.update_livestock(_id, updated_livestock)
-        return {"message": "Livestock updated successfully"}
-    except Exception as exc:
+        livestock = await db_li.update_livestock(sess, _id, values)
+    except IntegrityError as exc:
+        # the location was deleted after it was checked
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail="Livestock with supplied ID does not exist",
+            detail="Location with supplied ID does not exist",
         ) from exc
+    if livestock is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Livestock with supplied ID does not exist",
+        )
+    return {"message": "Livestock updated successfully"}
 
 
 @livestock_router.delete("/{_id}", response_model=dict)
-async def delete_livestock(_id: int, _: str = Depends(get_user)) -> dict:
+async def delete_livestock(
+    _id: UUID, sess: AsyncSession = Depends(get_session), _: str = Depends(get_user)
+) -> dict:
     """
     Deletes a livestock record from the database.
 
     Args:
         _id: The ID of the livestock record to delete.
+        sess: The database session of the current request.
         current_user: The currently authenticated user.
 
     Returns:
@@ -130,11 +337,9 @@ async def delete_livestock(_id: int, _: str = Depends(get_user)) -> dict:
     Raises:
         HTTPException 404: If the livestock record with the given ID is not found.
     """
-    try:
-        db_li.delete_livestock(_id)
-        return {"message": "Livestock deleted successfully"}
-    except Exception as exc:
+    if await db_li.delete_livestock(sess, _id) is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Livestock with supplied ID does not exist",
-        ) from exc
+        )
+    return {"message": "Livestock deleted successfully"}
@@ -1,26 +1,40 @@
 """
 This API provides functionalities to manage location records, including creating, retrieving,
 updating, and deleting records.
+
+Location reads stay on the primary even when read replicas are configured: they are served from
+the in-process location cache, which a lagging replica would fill with outdated records.
 """
-from typing import List
-from fastapi import APIRouter, Body, Depends, HTTPException, status
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Response, status
+from pydantic import TypeAdapter
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 import app.databases.location as db
-from app.schemas.location import Location
+from app.databases.connection import get_session
+from app.databases.cursor import InvalidCursor
+from app.schemas.location import Location, LocationPage, LocationUpdate
 from app.auth.jwt import get_user
+from app.etag import Conditional, etag
+from app.responses import json_response
+
+location_page = TypeAdapter(LocationPage)
 
 location_router = APIRouter(tags=["Locations"])
 
 
 @location_router.post("/", response_model=dict)
 async def create_location(
-    location: Location = Body(...), _: str = Depends(get_user)
+    location: Location = Body(...),
+    sess: AsyncSession = Depends(get_session),
+    _: str = Depends(get_user),
 ) -> dict:
     """
     Creates a new location record in the database.
 
     Args:
         location: A Location object containing information about the new location.
+        sess: The database session of the current request.
         current_user: The currently authenticated user.
 
     Returns:
@@ -30,7 +44,7 @@ async def create_location(
         HTTPException 500: If an error occurs while creating the location record.
     """
     try:
-        _id = db.create_location(location.to_db())
+        _id = await db.create_location(sess, location)
         return {"message": f"Location created successfully with ID {_id}"}
     except Exception as exc:
         raise HTTPException(
@@ -39,27 +53,57 @@ async def create_location(
         ) from exc
 
 
-@location_router.get("/", response_model=List[dict])
-async def retrieve_all_locations(_: str = Depends(get_user)) -> List[dict]:
+@location_router.get("/", response_model=LocationPage)
+async def retrieve_all_locations(
+    limit: int = Query(100, ge=1, le=1000),
+    after: str = None,
+    sess: AsyncSession = Depends(get_session),
+    _: str = Depends(get_user),
+    conditional: Conditional = Depends(etag(*db.TABLES, session=get_session)),
+) -> Response:
     """
-    Retrieves a list of all location records from the database.
+    Retrieves a page of location records from the database.
 
     Args:
+        limit: The maximum number of records to return.
+        after: The `next` cursor of the previous page, or None for the first page.
+        sess: The database session of the current request.
         current_user: The currently authenticated user.
+        conditional: The version of the location table, which the ETag of the response is
+            derived from and the page is cached under.
 
     Returns:
-        A list of dictionaries, each representing a location record.
+        A JSON response containing the list of location records of this page under `items` and
+        the cursor of the next page under `next` (None on the last page).
+
+    Raises:
+        HTTPException 304: If the client already has this page, per its `If-None-Match` header.
+        HTTPException 400: If the supplied cursor is malformed.
     """
-    return db.get_locations()
+    try:
+        locations, next_cursor = await db.get_locations(sess, limit, after, conditional.versions)
+    except InvalidCursor as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid pagination cursor",
+        ) from exc
+    return json_response(
+        location_page,
+        {"items": locations, "next": next_cursor},
+        headers={"ETag": conditional.tag()},
+    )
 
 
 @location_router.get("/{_id}", response_model=dict)
-async def retrieve_location(_id: int, _: str = Depends(get_user)) -> dict:
+async def retrieve_location(
+    _id: int, sess: AsyncSession = Depends(get_session), _: str = Depends(get_user)
+) -> dict:
     """
     Retrieves a specific location record by its ID.
 
     Args:
         _id: The ID of the location record to retrieve.
+        sess: The database session of the current request.
         current_user: The currently authenticated user.
 
     Returns:
@@ -68,7 +112,7 @@ async def retrieve_location(_id: int, _: str = Depends(get_user)) -> dict:
     Raises:
         HTTPException 404: If the location record with the given ID is not found.
     """
-    location = db.get_location_by_id(_id)
+    location = await db.get_location_by_id(sess, _id)
     if location is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -79,14 +123,18 @@ async def retrieve_location(_id: int, _: str = Depends(get_user)) -> dict:
 
 @location_router.patch("/{_id}", response_model=dict)
 async def update_location(
-    _id: int, updated_location: dict = Body(...), _: str = Depends(get_user)
+    _id: int,
+    updated_location: LocationUpdate = Body(...),
+    sess: AsyncSession = Depends(get_session),
+    _: str = Depends(get_user),
 ) -> dict:
     """
     Updates an existing location record in the database.
 
     Args:
         _id: The ID of the location record to update.
-        updated_location: A dictionary containing updated information for the location.
+        updated_location: A LocationUpdate object containing the fields to change.
+        sess: The database session of the current request.
         current_user: The currently authenticated user.
 
     Returns:
@@ -94,24 +142,35 @@ async def update_location(
 
     Raises:
         HTTPException 404: If the location record with the given ID is not found.
+        HTTPException 409: If the changes violate a constraint of the location table.
     """
     try:
-        db.update_location(_id, updated_location)
-        return {"message": "Location updated successfully"}
-    except Exception as exc:
+        location = await db.update_location(
+            sess, _id, updated_location.model_dump(exclude_none=True)
+        )
+    except IntegrityError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Location update conflicts with the existing records",
+        ) from exc
+    if location is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Location with supplied ID does not exist",
-        ) from exc
+        )
+    return {"message": "Location updated successfully"}
 
 
 @location_router.delete("/{_id}", response_model=dict)
-async def delete_location(_id: int, _: str = Depends(get_user)) -> dict:
+async def delete_location(
+    _id: int, sess: AsyncSession = Depends(get_session), _: str = Depends(get_user)
+) -> dict:
     """
     Deletes a location record from the database.
 
     Args:
         _id: The ID of the location record to delete.
+        sess: The database session of the current request.
         current_user: The currently authenticated user.
 
     Returns:
@@ -119,12 +178,18 @@ async def delete_location(_id: int, _: str = Depends(get_user)) -> dict:
 
     Raises:
         HTTPException 404: If the location record with the given ID is not found.
+        HTTPException 409: If livestock were born at the location or are still there.
     """
     try:
-        db.delete_location(_id)
-        return {"message": "Location deleted successfully"}
-    except Exception as exc:
+        deleted_id = await db.delete_location(sess, _id)
+    except IntegrityError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Location is still referenced by livestock",
+        ) from exc
+    if deleted_id is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Location with supplied ID does not exist",
-        ) from exc
+        )
+    return {"message": "Location deleted successfully"}
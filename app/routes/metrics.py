@@ -0,0 +1,29 @@
+"""
+This API exposes the metrics of the service in the Prometheus text exposition format.
+"""
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app import metrics
+from app.auth.password import hash_pool
+from app.databases.connection import engine, pool_stats, replica_engines
+
+metrics_router = APIRouter(tags=["Metrics"])
+
+
+@metrics_router.get("/metrics", response_class=PlainTextResponse)
+async def retrieve_metrics() -> PlainTextResponse:
+    """
+    Reports the request, database and section metrics of this worker.
+
+    Returns:
+        A plain text response in the Prometheus text exposition format.
+    """
+    for name, eng in {"primary": engine, **replica_engines}.items():
+        pool = pool_stats(eng)
+        for state in ("checked_in", "checked_out", "overflow"):
+            metrics.db_pool_connections.set(pool[state], name, state)
+    metrics.password_hash_pending.set(hash_pool.pending)
+    return PlainTextResponse(
+        metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -1,17 +1,45 @@
 """
 This API provides functionalities to predict the number of livestock for the next three years based
-on past data.
+on past data. Forecasts are cached per location until the livestock of that location change, and
+are tagged with the versions of the livestock and headcount tables, so that polling clients can
+revalidate them with `If-None-Match`. The cached forecasts are computed from the primary, since a
+lagging replica would leave outdated forecasts in the cache; `GET /predicts/batch` is not cached
+and reads from the read replicas when they are configured.
+
+`GET /predicts/batch` forecasts every location at once: the counts of all locations come from one
+aggregated query and every per-location trend is solved in a single vectorized computation.
+
+NumPy and scikit-learn are only imported by the first prediction, or by `warm_up` when the
+application is configured to load them in the background after startup, so that workers do not
+pay for them before they are needed.
 """
-import numpy as np
-from fastapi import APIRouter, Depends, HTTPException, status
-from sklearn.linear_model import LinearRegression
+from typing import Dict
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
 
 import app.databases.livestock as db
+from app.databases.connection import get_session
+from app.databases.replica import get_read_session
 from app.auth.jwt import get_user
+from app.etag import Conditional, etag
+from app.forecast import FORECAST_TABLES, forecast_cache
+from app.metrics import timed
+
+forecast_etag = etag(*FORECAST_TABLES, session=get_session)
+batch_etag = etag(*FORECAST_TABLES)
 
 predict_router = APIRouter(tags=["Predicts"])
 
 
+def warm_up():
+    """
+    Imports the numerical libraries used for predictions ahead of the first prediction.
+    """
+    # scikit-learn imports NumPy and SciPy itself
+    # pylint: disable-next=import-outside-toplevel,unused-import
+    import sklearn.linear_model
+
+
 def predict_data(livestocks_count, _: str = Depends(get_user)):
     """
     Predicts the number of livestock for the next three years based on past data.
@@ -24,6 +52,12 @@ def predict_data(livestocks_count, _: str = Depends(get_user)):
     Returns:
         A dictionary mapping predicted years to predicted counts of livestock.
     """
+    # pylint: disable-next=import-outside-toplevel
+    import numpy as np
+
+    # pylint: disable-next=import-outside-toplevel
+    from sklearn.linear_model import LinearRegression
+
     years = np.array(list(livestocks_count.keys()))
     counts = np.array(list(livestocks_count.values()))
 
@@ -41,75 +75,200 @@ def predict_data(livestocks_count, _: str = Depends(get_user)):
     )
 
 
+def predict_batch(counts_by_location: Dict[int, Dict[int, int]]) -> Dict[int, dict]:
+    """
+    Predicts the number of livestock for the next three years of many locations at once.
+
+    The counts are laid out as a location x year matrix, with a mask marking the years a location
+    has data for, and the least-squares line of every row is solved in closed form. Years and
+    counts are integers, so the predictions are computed as exact integer fractions and floored
+    without rounding errors. The result matches fitting one `predict_data` model per location,
+    except where a prediction is exactly an integer and the floating point fit lands just below
+    it.
+
+    Args:
+        counts_by_location: A dictionary mapping location IDs to dictionaries mapping years to
+        counts of livestock, each with at least two years.
+
+    Returns:
+        A dictionary mapping each location ID to a dictionary mapping predicted years to
+        predicted counts of livestock.
+    """
+    # pylint: disable-next=import-outside-toplevel
+    import numpy as np
+
+    locations = list(counts_by_location)
+    years = np.array(sorted({y for i in counts_by_location.values() for y in i}), dtype=np.int64)
+    column = {int(year): i for i, year in enumerate(years)}
+    counts = np.zeros((len(locations), len(years)), dtype=np.int64)
+    mask = np.zeros((len(locations), len(years)), dtype=bool)
+    for row, location_id in enumerate(locations):
+        for year, count in counts_by_location[location_id].items():
+            counts[row, column[year]] = count
+            mask[row, column[year]] = True
+
+    # sums of the normal equations per row, with years counted from the first year
+    offsets = np.where(mask, years - years[0], 0)
+    samples = mask.sum(axis=1)
+    sum_x = offsets.sum(axis=1)
+    sum_y = counts.sum(axis=1)
+    sum_xx = (offsets * offsets).sum(axis=1)
+    sum_xy = (offsets * counts).sum(axis=1)
+    # slope = slope_num / slope_den, prediction = (sum_y + slope * (n * x - sum_x)) / n
+    slope_num = samples * sum_xy - sum_x * sum_y
+    slope_den = samples * sum_xx - sum_x * sum_x
+
+    max_years = np.where(mask, years, years[0]).max(axis=1)
+    predicted_years = max_years[:, None] + np.arange(1, 4)
+    predicted_offsets = predicted_years - years[0]
+    predicted_counts = (
+        sum_y[:, None] * slope_den[:, None]
+        + slope_num[:, None] * (samples[:, None] * predicted_offsets - sum_x[:, None])
+    ) // (samples * slope_den)[:, None]
+
+    return {
+        location_id: dict(
+            zip(
+                predicted_years[row].tolist(),
+                predicted_counts[row].tolist(),
+            )
+        )
+        for row, location_id in enumerate(locations)
+    }
+
+
+async def forecast(sess: AsyncSession, location_id: int = None) -> dict:
+    """
+    Counts the livestock per birth year and predicts the next three years from those counts.
+
+    Args:
+        sess: The database session to read with.
+        location_id: The ID of the location to forecast, or None for all locations.
+
+    Returns:
+        A dictionary containing a message, a dictionary of current year data, and a dictionary of
+        predicted year data.
+    """
+    livestocks_count = await db.count_livestocks_by_year(sess, location_id)
+    if len(livestocks_count) <= 1:
+        return {"message": "Not enough data to predict"}
+    with timed("forecast_fit"):
+        predicted = predict_data(livestocks_count)
+    return {
+        "message": "Predicted data for 3 years ahead",
+        "current_data": livestocks_count,
+        "predicted_data": predicted,
+    }
+
+
 @predict_router.get("/", response_model=dict)
-async def retrieve_all_predicts(_: str = Depends(get_user)) -> dict:
+async def retrieve_all_predicts(
+    response: Response,
+    sess: AsyncSession = Depends(get_session),
+    _: str = Depends(get_user),
+    conditional: Conditional = Depends(forecast_etag),
+) -> dict:
     """
     Retrieves predicted data for all livestock across all locations.
 
     Args:
+        response: The response, whose `ETag` is set to the versions the forecast was computed at.
+        sess: The database session of the current request.
         _: A string representing the currently authenticated user. This is injected by the Depends
         decorator.
+        conditional: The change versions read for the request.
 
     Returns:
         A dictionary containing a message, a dictionary of current year data, and a dictionary of
         predicted year data.
     
     Raises:
+        HTTPException 304: If the client already has this forecast, per its `If-None-Match` header.
         HTTPException 404: If there is not enough data to make a prediction.
     """
-    livestocks = db.get_livestocks()
-    livestocks_count = {}
-    for livestock in livestocks:
-        year = int(livestock.get("birthdate").isoformat().split("-")[0])
-        if year in livestocks_count:
-            livestocks_count[year] += 1
-        else:
-            livestocks_count[year] = 1
-    if len(livestocks_count) <= 1:
-        return {"message": "Not enough data to predict"}
-    return {
-        "message": "Predicted data for 3 years ahead",
-        "current_data": livestocks_count,
-        "predicted_data": predict_data(livestocks_count),
-    }
+    predicts, versions = await forecast_cache.get(sess, None, forecast, conditional.versions)
+    response.headers["ETag"] = conditional.tag(versions)
+    return predicts
+
+
+@predict_router.get("/batch", response_model=dict)
+async def retrieve_batch_predicts(
+    response: Response,
+    sess: AsyncSession = Depends(get_read_session),
+    _: str = Depends(get_user),
+    conditional: Conditional = Depends(batch_etag),
+) -> dict:
+    """
+    Retrieves predicted data for the livestock of every location in one pass.
+
+    Args:
+        response: The response, whose `ETag` is set to the current versions.
+        sess: The database session of the current request.
+        _: A string representing the currently authenticated user. This is injected by the Depends
+        decorator.
+        conditional: The change versions read for the request.
+
+    Returns:
+        A dictionary mapping each location ID with livestock to a dictionary containing a message,
+        a dictionary of current year data, and a dictionary of predicted year data.
+
+    Raises:
+        HTTPException 304: If the client already has these forecasts, per its `If-None-Match`
+        header.
+    """
+    response.headers["ETag"] = conditional.tag()
+    counts_by_location = await db.count_livestocks_by_location_and_year(sess)
+    predictable = {k: v for k, v in counts_by_location.items() if len(v) > 1}
+    with timed("forecast_batch_fit"):
+        predicted = predict_batch(predictable) if predictable else {}
+    predicts = {}
+    for location_id, livestocks_count in counts_by_location.items():
+        if location_id not in predicted:
+            predicts[location_id] = {"message": "Not enough data to predict"}
+            continue
+        predicts[location_id] = {
+            "message": "Predicted data for 3 years ahead",
+            "current_data": livestocks_count,
+            "predicted_data": predicted[location_id],
+        }
+    return predicts
 
 
 @predict_router.get("/{location_id}", response_model=dict)
-async def retrieve_predict(location_id: int, _: str = Depends(get_user)) -> dict:
+async def retrieve_predict(
+    location_id: int,
+    response: Response,
+    sess: AsyncSession = Depends(get_session),
+    _: str = Depends(get_user),
+    conditional: Conditional = Depends(forecast_etag),
+) -> dict:
     """
     Retrieves predicted data for livestock at a specific location.
 
     Args:
         location_id: The ID of the location for which to predict the number of livestock.
+        response: The response, whose `ETag` is set to the versions the forecast was computed at.
+        sess: The database session of the current request.
         _: A string representing the currently authenticated user. This is injected by the Depends
         decorator.
+        conditional: The change versions read for the request.
 
     Returns:
         A dictionary containing a message, a dictionary of current year data, and a dictionary of
         predicted year data.
     
     Raises:
+        HTTPException 304: If the client already has this forecast, per its `If-None-Match` header.
         HTTPException 404: If the location with the supplied ID does not exist.
     """
     try:
-        livestocks = db.get_livestocks()
-        livestocks_count = {}
-        for livestock in livestocks:
-            if livestock.get("location_id") == location_id:
-                year = int(livestock.get("birthdate").isoformat().split("-")[0])
-                if year in livestocks_count:
-                    livestocks_count[year] += 1
-                else:
-                    livestocks_count[year] = 1
-        if len(livestocks_count) <= 1:
-            return {"message": "Not enough data to predict"}
-        return {
-            "message": "Predicted data for 3 years ahead",
-            "current_data": livestocks_count,
-            "predicted_data": predict_data(livestocks_count),
-        }
+        predicts, versions = await forecast_cache.get(
+            sess, location_id, forecast, conditional.versions
+        )
     except Exception as exc:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Location with supplied ID does not exist",
         ) from exc
+    response.headers["ETag"] = conditional.tag(versions)
+    return predicts
@@ -0,0 +1,69 @@
+"""
+This API provides admin access to the request profiles recorded by `app.profiling`.
+"""
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import PlainTextResponse
+
+from app.auth.jwt import get_admin
+from app.profiling import get_profile
+
+profile_router = APIRouter(tags=["Profiles"])
+
+
+def find_profile(profile_id: str) -> dict:
+    """
+    Looks up a stored profile.
+
+    Raises:
+        HTTPException 404: If the profile does not exist or was evicted.
+    """
+    profile = get_profile(profile_id)
+    if profile is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profile with supplied ID does not exist",
+        )
+    return profile
+
+
+@profile_router.get("/{profile_id}", response_model=dict)
+async def retrieve_profile(profile_id: str, _: str = Depends(get_admin)) -> dict:
+    """
+    Retrieves a request profile with its timings and folded stacks.
+
+    Args:
+        profile_id: The ID returned in the `X-Profile-Id` header of the profiled response.
+        _: A string representing the currently authenticated admin. This is injected by the
+        Depends decorator.
+
+    Returns:
+        A dictionary describing the request, its duration and database time, and its samples as
+        folded stacks under `folded`.
+
+    Raises:
+        HTTPException 403: If the user is not an admin.
+        HTTPException 404: If the profile does not exist or was evicted.
+    """
+    return find_profile(profile_id)
+
+
+@profile_router.get("/{profile_id}/folded", response_class=PlainTextResponse)
+async def retrieve_profile_folded(
+    profile_id: str, _: str = Depends(get_admin)
+) -> PlainTextResponse:
+    """
+    Retrieves the folded stacks of a request profile, for flamegraph.pl or speedscope.
+
+    Args:
+        profile_id: The ID returned in the `X-Profile-Id` header of the profiled response.
+        _: A string representing the currently authenticated admin. This is injected by the
+        Depends decorator.
+
+    Returns:
+        A plain text response with one `frame;frame;frame count` line per sampled stack.
+
+    Raises:
+        HTTPException 403: If the user is not an admin.
+        HTTPException 404: If the profile does not exist or was evicted.
+    """
+    return PlainTextResponse(find_profile(profile_id)["folded"])
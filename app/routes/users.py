@@ -4,32 +4,51 @@ registration.
 """
 from fastapi import APIRouter, HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordRequestForm
-from passlib.context import CryptContext
+from sqlalchemy.ext.asyncio import AsyncSession
 
 import app.databases.user as db
+from app.databases.connection import get_session
 from app.auth.jwt import create_access_token
+from app.auth.password import HashPoolBusy, hash_password, verify_password
 from app.schemas.user import User
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 user_router = APIRouter(tags=["Users"])
 
 
+def busy_exception() -> HTTPException:
+    """
+    Creates the error returned when the password hashing pool is full.
+
+    Returns:
+        An HTTPException 503 asking the client to retry shortly.
+    """
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many concurrent sign-ins, please retry",
+        headers={"Retry-After": "1"},
+    )
+
+
 @user_router.post("/token")
-async def generate_token(form_data: OAuth2PasswordRequestForm = Depends()):
+async def generate_token(
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    sess: AsyncSession = Depends(get_session),
+):
     """
     Generates a JSON Web Token (JWT) for an existing user.
 
     Args:
         form_data: An OAuth2PasswordRequestForm object containing username and password.
+        sess: The database session of the current request.
 
     Returns:
         A dictionary containing the access token and token type.
 
     Raises:
         HTTPException 401: If the username or password is incorrect.
+        HTTPException 503: If too many passwords are already being checked.
     """
-    user = db.get_user_by_username(form_data.username)
+    user = await db.get_user_by_username(sess, form_data.username)
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Incorrect username or password",
@@ -37,8 +56,11 @@ async def generate_token(form_data: OAuth2PasswordRequestForm = Depends()):
     )
     if not user:
         raise credentials_exception
-    if not pwd_context.verify(form_data.password, user.get("password")):
-        raise credentials_exception
+    try:
+        if not await verify_password(form_data.password, user.get("password")):
+            raise credentials_exception
+    except HashPoolBusy as exc:
+        raise busy_exception() from exc
     access_token = create_access_token(
         {"sub": user.get("username"), "admin": user.get("admin")}
     )
@@ -46,25 +68,30 @@ async def generate_token(form_data: OAuth2PasswordRequestForm = Depends()):
 
 
 @user_router.post("/register")
-async def register(form_data: User):
+async def register(form_data: User, sess: AsyncSession = Depends(get_session)):
     """
     Registers a new user.
 
     Args:
         form_data: A User object containing user information.
+        sess: The database session of the current request.
 
     Returns:
         A dictionary containing a success message.
 
     Raises:
         HTTPException 400: If a user with the same username already exists.
+        HTTPException 503: If too many passwords are already being hashed.
     """
-    user = db.get_user_by_username(form_data.username)
+    user = await db.get_user_by_username(sess, form_data.username)
     if user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="User already exists"
         )
-    form_data.password = pwd_context.hash(form_data.password)
-    _id = db.create_user(form_data.to_db())
+    try:
+        form_data.password = await hash_password(form_data.password)
+    except HashPoolBusy as exc:
+        raise busy_exception() from exc
+    _id = await db.create_user(sess, form_data)
     # print(form_data)
     return {"message": f"User created successfully with ID {_id}"}
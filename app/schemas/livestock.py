@@ -1,8 +1,11 @@
 """
 This module defines Pydantic models for managing livestock records in the application.
 """
-from datetime import date
+from datetime import date, datetime
+from typing import List, Literal, Optional
+from uuid import UUID
 from pydantic import BaseModel
+from typing_extensions import TypedDict
 from app.models.model import LivestockDB
 
 
@@ -17,6 +20,7 @@ class Livestock(BaseModel):
     * **birthdate**: The date of birth of the livestock.
     * **gender**: The gender of the livestock.
     * **location_id**: The ID of the current location of the livestock.
+    * **external_id**: An optional identifier of the livestock in the client's own records.
     """
 
     name: str
@@ -24,8 +28,9 @@ class Livestock(BaseModel):
     species: str
     birthplace_id: int
     birthdate: date
-    gender: str
+    gender: Literal["male", "female"]
     location_id: int
+    external_id: Optional[str] = None
 
     def to_db(self):
         """
@@ -35,3 +40,73 @@ class Livestock(BaseModel):
             A LivestockDB object containing the information from the Livestock object.
         """
         return LivestockDB(**self.model_dump())
+
+
+class LivestockUpdate(BaseModel):
+    """
+    Represents the changes to a livestock record. Fields left out, or set to null, are kept as
+    they are; the external ID cannot be changed.
+
+    * **name**: The name of the livestock.
+    * **breed**: The breed of the livestock.
+    * **species**: The species of the livestock.
+    * **birthplace_id**: The ID of the location where the livestock was born.
+    * **birthdate**: The date of birth of the livestock.
+    * **gender**: The gender of the livestock.
+    * **location_id**: The ID of the current location of the livestock.
+    """
+
+    name: Optional[str] = None
+    breed: Optional[str] = None
+    species: Optional[str] = None
+    birthplace_id: Optional[int] = None
+    birthdate: Optional[date] = None
+    gender: Optional[Literal["male", "female"]] = None
+    location_id: Optional[int] = None
+
+
+class LivestockFilter(BaseModel):
+    """
+    Represents the optional filters of a livestock query. Unset filters match every record.
+
+    * **location_id**: Only match livestock currently at this location.
+    * **species**: Only match livestock of this species.
+    * **breed**: Only match livestock of this breed.
+    * **gender**: Only match livestock of this gender.
+    * **born_after**: Only match livestock born on or after this date.
+    * **born_before**: Only match livestock born strictly before this date.
+    """
+
+    location_id: Optional[int] = None
+    species: Optional[str] = None
+    breed: Optional[str] = None
+    gender: Optional[Literal["male", "female"]] = None
+    born_after: Optional[date] = None
+    born_before: Optional[date] = None
+
+
+class LivestockOut(TypedDict):
+    """
+    Represents a livestock record as returned by the API. It is a TypedDict so that the records
+    read from the database are serialized to JSON as they are, without being copied into models
+    first.
+    """
+
+    id: UUID
+    name: str
+    breed: str
+    species: str
+    birthplace_id: int
+    birthdate: datetime
+    gender: str
+    location_id: int
+    external_id: Optional[str]
+
+
+class LivestockPage(TypedDict):
+    """
+    Represents a page of livestock records and the cursor of the next page, if any.
+    """
+
+    items: List[LivestockOut]
+    next: Optional[str]
@@ -1,7 +1,9 @@
 """
 This module defines Pydantic models for managing location records in the application.
 """
+from typing import List, Literal, Optional
 from pydantic import BaseModel
+from typing_extensions import TypedDict
 
 from app.models.model import LocationDB
 
@@ -27,3 +29,38 @@ class Location(BaseModel):
             A LocationDB object containing the information from the Location object.
         """
         return LocationDB(**self.model_dump())
+
+
+class LocationUpdate(BaseModel):
+    """
+    Represents the changes to a location record. Fields left out, or set to null, are kept as
+    they are.
+
+    * **type**: The type of the location (farm, market or warehouse).
+    * **name**: The name of the location.
+    * **address**: The address of the location.
+    """
+
+    type: Optional[Literal["farm", "market", "warehouse"]] = None
+    name: Optional[str] = None
+    address: Optional[str] = None
+
+
+class LocationOut(TypedDict):
+    """
+    Represents a location record as returned by the API, with its `id`.
+    """
+
+    id: int
+    type: str
+    name: str
+    address: str
+
+
+class LocationPage(TypedDict):
+    """
+    Represents a page of location records and the cursor of the next page, if any.
+    """
+
+    items: List[LocationOut]
+    next: Optional[str]
@@ -0,0 +1,104 @@
+"""
+Measures the cold start of a worker: the time it takes to import the application and the memory
+the worker holds afterwards, then the cost of loading the prediction libraries on top of that.
+
+Every run starts a fresh interpreter, so nothing is cached between runs except by the operating
+system. The application is imported from a temporary directory with its own `.env` pointing at an
+empty SQLite database, so no database server is needed.
+
+Usage:
+    python benchmarks/cold_start.py --runs 10 > cold_start.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# runs in the fresh interpreter and prints one JSON object
+PROBE = """
+import json, sys, time
+
+def rss_mb():
+    with open("/proc/self/status", encoding="utf-8") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return None
+
+start = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+report = {
+    "import_seconds": imported - start,
+    "rss_mb": rss_mb(),
+    "numpy_loaded": "numpy" in sys.modules,
+    "sklearn_loaded": "sklearn" in sys.modules,
+}
+import sklearn.linear_model  # what the first prediction loads
+report["warm_up_seconds"] = time.perf_counter() - imported
+report["warm_rss_mb"] = rss_mb()
+print(json.dumps(report))
+"""
+
+
+def run_once(workdir: str) -> dict:
+    """
+    Imports the application in a fresh interpreter and returns what the probe measured.
+    """
+    env = {**os.environ, "PYTHONPATH": ROOT, "PYTHONDONTWRITEBYTECODE": "1"}
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=workdir,
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def summarize(values: list) -> dict:
+    """
+    Returns the median, minimum and maximum of a list of measurements.
+    """
+    return {
+        "median": statistics.median(values),
+        "min": min(values),
+        "max": max(values),
+    }
+
+
+def main(argv: list = None):
+    """
+    Runs the cold start probe several times and prints a JSON report.
+    """
+    parser = argparse.ArgumentParser(description="Measure the cold start of a worker.")
+    parser.add_argument("--runs", type=int, default=5, help="number of fresh interpreters")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        with open(os.path.join(workdir, ".env"), "w", encoding="utf-8") as env:
+            env.write(f"DB_URL=sqlite:///{os.path.join(workdir, 'bench.db')}\n")
+            env.write("SECRET_KEY=benchmark\nALGORITHM=HS256\nACCESS_TOKEN_EXPIRE_MINUTES=30\n")
+        run_once(workdir)  # warms the operating system's file cache
+        runs = [run_once(workdir) for _ in range(args.runs)]
+
+    report = {
+        "python": sys.version.split()[0],
+        "runs": args.runs,
+        "numpy_loaded_at_import": any(i["numpy_loaded"] for i in runs),
+        "sklearn_loaded_at_import": any(i["sklearn_loaded"] for i in runs),
+    }
+    for key in ("import_seconds", "rss_mb", "warm_up_seconds", "warm_rss_mb"):
+        if all(i[key] is not None for i in runs):
+            report[key] = summarize([i[key] for i in runs])
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""
+Benchmarks the HTTP API in process: seeds a database with a configurable number of livestock,
+drives the real `app.main:app` through an ASGI client with concurrent clients, and prints the
+throughput and latency percentiles of each route as JSON, so that runs can be compared across
+commits.
+
+The application is imported from a temporary directory holding its own `.env`. The database is
+either a SQLite file in that directory (the default) or a PostgreSQL database given with
+`--db-url`. Its tables are dropped and recreated, so only point it at a scratch database.
+
+Usage:
+    pip install -r benchmarks/requirements.txt
+    python benchmarks/http_bench.py --rows 100000 --concurrency 16 > bench.json
+    python benchmarks/http_bench.py --rows 1000000 --db-url postgresql://bench@localhost/bench
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SEED_BATCH_SIZE = 10000
+LOCATIONS = 50
+USERNAME = "bench"
+PASSWORD = "bench"
+
+# route name -> (method, path); {location} is replaced by a seeded location ID
+ROUTES = {
+    "livestocks": ("GET", "/livestocks/?limit=100"),
+    "livestocks_filtered": ("GET", "/livestocks/?location_id={location}&species=cow&limit=100"),
+    "locations": ("GET", "/locations/?limit=100"),
+    "predicts": ("GET", "/predicts/"),
+    "predicts_location": ("GET", "/predicts/{location}"),
+    "predicts_batch": ("GET", "/predicts/batch"),
+    "token": ("POST", "/token"),
+}
+
+
+def prepare_environment(workdir: str, db_url: str):
+    """
+    Writes the `.env` of the benchmarked application and makes it importable from `workdir`.
+    """
+    with open(os.path.join(workdir, ".env"), "w", encoding="utf-8") as env:
+        env.write(f"DB_URL={db_url}\n")
+        env.write("SECRET_KEY=benchmark\nALGORITHM=HS256\nACCESS_TOKEN_EXPIRE_MINUTES=60\n")
+    # app.config reads the .env of the working directory when it is first imported
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+
+
+async def seed(rows: int, rng: random.Random):
+    """
+    Recreates the tables and fills them with locations, livestock and the benchmark user.
+    """
+    # pylint: disable=import-outside-toplevel
+    from app.auth.password import pwd_context
+    from app.databases.connection import Session, engine
+    from app.databases.livestock import LIVESTOCK_COLUMNS, load_livestocks
+    from app.models import model, user
+
+    async with engine.begin() as conn:
+        for base in (model.Base, user.Base):
+            await conn.run_sync(base.metadata.drop_all)
+            await conn.run_sync(base.metadata.create_all)
+
+    async with Session() as sess:
+        sess.add_all(
+            model.LocationDB(id=i, type="farm", name=f"Farm {i}", address=f"Road {i}")
+            for i in range(1, LOCATIONS + 1)
+        )
+        sess.add(user.UserDB(username=USERNAME, password=pwd_context.hash(PASSWORD)))
+        await sess.commit()
+
+        for start in range(0, rows, SEED_BATCH_SIZE):
+            records = []
+            for _ in range(min(SEED_BATCH_SIZE, rows - start)):
+                record = {
+                    "id": uuid.uuid4(),
+                    "name": f"Animal {rng.randrange(10**6)}",
+                    "breed": rng.choice(["angus", "holstein", "merino", "boer"]),
+                    "species": rng.choice(["cow", "sheep", "goat"]),
+                    "birthplace_id": rng.randint(1, LOCATIONS),
+                    "birthdate": datetime(rng.randint(2000, 2023), rng.randint(1, 12), 1),
+                    "gender": rng.choice(["male", "female"]),
+                    "location_id": rng.randint(1, LOCATIONS),
+                    "external_id": None,
+                }
+                records.append(tuple(record[i] for i in LIVESTOCK_COLUMNS))
+            await load_livestocks(sess, records)
+            await sess.commit()
+
+
+def percentile(latencies: list, q: int) -> float:
+    """
+    Returns the q-th percentile of a sorted list of latencies.
+    """
+    if len(latencies) == 1:
+        return latencies[0]
+    return statistics.quantiles(latencies, n=100, method="inclusive")[q - 1]
+
+
+async def bench_route(client, method: str, path: str, requests: int, concurrency: int, **kwargs):
+    """
+    Sends `requests` requests to a route from `concurrency` concurrent clients.
+
+    Returns:
+        The number of requests, errors, the throughput and the latency percentiles.
+    """
+    latencies = []
+    errors = 0
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            response = await client.request(method, path, **kwargs)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "throughput_rps": requests / elapsed,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": latencies[-1] * 1000,
+    }
+
+
+async def bench_routes(client, args, rng: random.Random) -> dict:
+    """
+    Logs in and benchmarks the selected routes one after the other.
+
+    Returns:
+        The results of every route, by name.
+    """
+    results = {}
+    credentials = {"username": USERNAME, "password": PASSWORD}
+    token = (await client.post("/token", data=credentials)).json()["access_token"]
+    client.headers["Authorization"] = f"Bearer {token}"
+    for name in args.routes:
+        method, path = ROUTES[name]
+        path = path.format(location=rng.randint(1, LOCATIONS))
+        kwargs = {"data": credentials} if name == "token" else {}
+        requests = args.token_requests if name == "token" else args.requests
+        # the first requests fill the caches and the connection pool
+        await bench_route(client, method, path, args.warmup, 1, **kwargs)
+        results[name] = await bench_route(
+            client, method, path, requests, args.concurrency, **kwargs
+        )
+    return results
+
+
+async def run(args) -> dict:
+    """
+    Seeds the database and benchmarks the selected routes.
+    """
+    # pylint: disable=import-outside-toplevel
+    import httpx
+    from app.databases.connection import engine
+    from app.main import app
+
+    rng = random.Random(args.seed)
+    seed_started = time.perf_counter()
+    await seed(args.rows, rng)
+    seed_seconds = time.perf_counter() - seed_started
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        results = await bench_routes(client, args, rng)
+    await engine.dispose()
+    return {"seed_seconds": seed_seconds, "routes": results}
+
+
+def git_commit() -> str:
+    """
+    Returns the commit the benchmarked tree is at, or None outside a git checkout.
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, check=True, capture_output=True, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv: list = None):
+    """
+    Runs the benchmark and prints a JSON report.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the HTTP API in process.")
+    parser.add_argument(
+        "--rows", type=int, default=10000, help="livestock to seed, e.g. 10000, 100000, 1000000"
+    )
+    parser.add_argument(
+        "--db-url", help="scratch PostgreSQL database URL (default: a temporary SQLite file)"
+    )
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent clients")
+    parser.add_argument("--requests", type=int, default=1000, help="requests per route")
+    parser.add_argument(
+        "--token-requests", type=int, default=50, help="requests to /token, which runs bcrypt"
+    )
+    parser.add_argument("--warmup", type=int, default=5, help="unmeasured requests per route")
+    parser.add_argument("--routes", nargs="+", choices=list(ROUTES), default=list(ROUTES))
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the dataset")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db_url = args.db_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+        cwd = os.getcwd()
+        prepare_environment(workdir, db_url)
+        try:
+            report = asyncio.run(run(args))
+        finally:
+            os.chdir(cwd)
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "backend": "postgresql" if args.db_url else "sqlite",
+        "rows": args.rows,
+        "concurrency": args.concurrency,
+        **report,
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()